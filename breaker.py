@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Circuit breakers for the endpoints Comicvine talks to.
+
+Requests are split into endpoints (search, volume, issue and site_detail,
+the comicvine.com HTML pages listing a volume's issues), each with its own
+CircuitBreaker. When too many recent requests to an endpoint fail, its
+breaker opens, and further requests to it fail straight away with
+comicvine_unavailable instead of waiting on timeouts. Other endpoints, and
+anything the cache can answer, keep working. After reset_timeout seconds a
+single probe request is let through (half open); if it succeeds the breaker
+closes again, otherwise it stays open for another reset_timeout.
+
+>>> breaker = CircuitBreaker("search", failure_rate = 0.5, min_requests = 2, reset_timeout = 60)
+>>> breaker.before(); breaker.failure()
+>>> breaker.before(); breaker.failure()
+>>> breaker.state
+'open'
+>>> breaker.before()
+Traceback (most recent call last):
+...
+comicvine_unavailable: search requests are failing, not retrying for 60 seconds
+"""
+from __future__ import with_statement
+
+__author__ = "swc/Steve"
+__version__ = "1.00"
+
+import re
+import time
+import urllib2
+from collections import deque
+from threading import RLock
+
+from comicvine_exceptions import comicvine_unavailable
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitBreaker(object):
+    """Tracks the outcome of the last window requests to one endpoint
+    """
+    def __init__(self, name, failure_rate = 0.5, min_requests = 5, window = 20, reset_timeout = 30):
+        """The breaker opens once at least min_requests of the last window
+        requests have been made and failure_rate (0 to 1) of them failed.
+        reset_timeout is how long (in seconds) it stays open before a
+        probe request is allowed
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.lock = RLock()
+        self.outcomes = deque(maxlen = window)
+        self.state = CLOSED
+        self.opened_at = 0
+        self.probing = False
+        # Metrics
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def before(self):
+        """Called before each request. Raises comicvine_unavailable if the
+        breaker is open, or half open with a probe already in flight
+        """
+        with self.lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at >= self.reset_timeout:
+                    self.state = HALF_OPEN
+                    self.probing = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self.probing):
+                self.rejected += 1
+                raise comicvine_unavailable(
+                    "%s requests are failing, not retrying for %.0f seconds" % (
+                        self.name, max(0, self.opened_at + self.reset_timeout - time.time())
+                    )
+                )
+            if self.state == HALF_OPEN:
+                self.probing = True
+            self.requests += 1
+
+    def success(self):
+        """Records a successful request
+        """
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self.probing = False
+                self.outcomes.clear()
+            self.outcomes.append(True)
+
+    def failure(self):
+        """Records a failed request, opening the breaker if the failure
+        rate is over the threshold (or the request was the probe)
+        """
+        with self.lock:
+            self.failures += 1
+            self.outcomes.append(False)
+            failed = self.outcomes.count(False)
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED
+                    and len(self.outcomes) >= self.min_requests
+                    and failed >= self.failure_rate * len(self.outcomes)):
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.probing = False
+                self.trips += 1
+
+    def stats(self):
+        """Returns a dict of the breaker's state and counters
+        """
+        with self.lock:
+            return {
+                'state': self.state,
+                'requests': self.requests,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'trips': self.trips,
+                'recent_failure_rate': (
+                    self.outcomes.count(False) / float(len(self.outcomes))
+                    if self.outcomes else 0.0
+                ),
+            }
+
+
+# Comic Vine API paths, anything else is a site detail page
+_endpoint_paths = (
+    ('search', re.compile(r'^/search/')),
+    ('volume', re.compile(r'^/volume/\d+/')),
+    ('issue', re.compile(r'^/issue/\d+/')),
+)
+
+def endpoint_of(selector):
+    """Returns the endpoint a request path belongs to
+
+    >>> endpoint_of('/volume/18122/?api_key=x')
+    'volume'
+    >>> endpoint_of('/y-the-last-man/49-18122/?page=2')
+    'site_detail'
+    """
+    for name, path in _endpoint_paths:
+        if path.match(selector):
+            return name
+    return 'site_detail'
+
+
+class CircuitBreakers(object):
+    """One CircuitBreaker per endpoint, all made with the same settings
+    """
+    def __init__(self, **settings):
+        self.settings = settings
+        self.lock = RLock()
+        self.breakers = {}
+
+    def __getitem__(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(endpoint, **self.settings)
+            return self.breakers[endpoint]
+
+    def for_url(self, url):
+        """Returns the breaker for a full URL
+        """
+        return self[endpoint_of(urllib2.Request(url).get_selector())]
+
+    def stats(self):
+        """Returns the stats of every breaker used so far, by endpoint
+        """
+        with self.lock:
+            breakers = self.breakers.items()
+        return dict((endpoint, breaker.stats()) for endpoint, breaker in breakers)
+
+
+class BreakerHandler(urllib2.HTTPHandler):
+    """Wraps a transport (see transport.py), failing fast with
+    comicvine_unavailable while the breaker for a request's endpoint is open.
+    Connection errors and 5xx responses count as failures
+    """
+    def __init__(self, transport, breakers):
+        urllib2.HTTPHandler.__init__(self)
+        self.transport = transport
+        self.breakers = breakers
+
+    def http_open(self, req):
+        breaker = self.breakers[endpoint_of(req.get_selector())]
+        breaker.before()
+        try:
+            resp = self.transport.http_open(req)
+        except Exception:
+            breaker.failure()
+            raise
+        if resp.code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        return resp
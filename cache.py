@@ -17,12 +17,16 @@ __version__ = "1.01"
 
 import os
 import time
+import zlib
 import errno
+import marshal
 import httplib
+import tempfile
 import urllib2
 import StringIO
 from hashlib import md5
 from threading import RLock
+from xml.parsers import expat
 
 cache_lock = RLock()
 
@@ -71,29 +75,243 @@ def exists_in_cache(cache_location, url, max_age):
         # File does not exist
         return False
 
+def _stored_headers(headers, bodyhash):
+    """Returns the headers to store for a response, adding the md5 of its
+    body as x-body-md5 (see body_hash)
+    """
+    return "".join(
+        h for h in headers.headers if not h.lower().startswith("x-body-md5:")
+    ) + "x-body-md5: %s\r\n" % bodyhash.hexdigest()
+
 @locked_function
-def store_in_cache(cache_location, url, response):
-    """Tries to store response in cache."""
+def body_hash(cache_location, url, max_age):
+    """Returns the md5 (hex) of the body of a cached response, if it is
+    cached and up-to-date, otherwise None
+    """
+    if not exists_in_cache(cache_location, url, max_age):
+        return None
+    hpath, bpath = calculate_cache_path(cache_location, url)
+    return httplib.HTTPMessage(open(hpath)).get('x-body-md5')
+
+@locked_function
+def cache_validators(cache_location, url):
+    """Returns the conditional request headers (If-None-Match and
+    If-Modified-Since) for revalidating a cached response, from its stored
+    ETag and Last-Modified headers. Empty if the response is not cached or
+    has neither header
+    """
     hpath, bpath = calculate_cache_path(cache_location, url)
+    if not (os.path.exists(hpath) and os.path.exists(bpath)):
+        return {}
+    headers = httplib.HTTPMessage(open(hpath))
+    validators = {}
+    if headers.get('etag'):
+        validators['If-None-Match'] = headers['etag']
+    if headers.get('last-modified'):
+        validators['If-Modified-Since'] = headers['last-modified']
+    return validators
+
+@locked_function
+def refresh_in_cache(cache_location, url):
+    """Marks a cached response as up-to-date again, after the server said
+    it has not changed"""
+    for path in calculate_cache_path(cache_location, url):
+        os.utime(path, None)
+
+def _replace(partpath, path):
+    """Moves a finished temporary file over path
+    """
+    if os.name == "nt" and os.path.exists(path):
+        # Windows will not rename over an existing file
+        os.remove(path)
+    os.rename(partpath, path)
+
+def _remove(path):
     try:
-        outf = open(hpath, "w")
-        headers = str(response.info())
-        outf.write(headers)
-        outf.close()
+        os.remove(path)
+    except OSError:
+        pass
 
-        outf = open(bpath, "w")
-        outf.write(response.read())
+@locked_function
+def _commit_entry(cache_location, url, partpath, headers, bodyhash):
+    """Moves a body written to the temporary file partpath into the cache,
+    with its headers. Both files are written in full before being renamed
+    into place, so readers never see half of an entry
+    """
+    hpath, bpath = calculate_cache_path(cache_location, url)
+    fd, headerpath = tempfile.mkstemp(suffix = ".part", dir = cache_location)
+    try:
+        outf = os.fdopen(fd, "w")
+        outf.write(_stored_headers(headers, bodyhash))
         outf.close()
-    except IOError:
+        _replace(partpath, bpath)
+        _replace(headerpath, hpath)
+    except (IOError, OSError):
+        _remove(headerpath)
+        raise
+
+@locked_function
+def discard_from_cache(cache_location, url):
+    """Removes a cached response, if there is one"""
+    for path in calculate_cache_path(cache_location, url):
+        _remove(path)
+
+@locked_function
+def store_in_cache(cache_location, url, response):
+    """Tries to store response in cache. The body is only stored if it
+    passes BodyValidator. Returns False if it was stored, True if not"""
+    try:
+        fd, partpath = tempfile.mkstemp(suffix = ".part", dir = cache_location)
+    except (IOError, OSError):
         return True
-    else:
-        return False
+    validator = BodyValidator(response.info())
+    try:
+        outf = os.fdopen(fd, "wb")
+        # Copied in chunks, the body is never held in memory whole
+        bodyhash = md5()
+        while True:
+            chunk = response.read(16384)
+            if not chunk:
+                break
+            bodyhash.update(chunk)
+            validator.feed(chunk)
+            outf.write(chunk)
+        outf.close()
+        if validator.finish() is None:
+            _commit_entry(cache_location, url, partpath, response.info(), bodyhash)
+            return False
+    except (IOError, OSError):
+        pass
+    _remove(partpath)
+    return True
+
+def validate_body(headers, body):
+    """Returns why a whole response body fails BodyValidator, or None if it
+    passes
+    """
+    validator = BodyValidator(headers)
+    validator.feed(body)
+    return validator.finish()
+
+class BodyValidator(object):
+    """Checks a response body is complete and well-formed before it is
+    cached, fed the body (as sent, possibly gzipped) a chunk at a time.
+
+    The body must be as long as its Content-Length, and not empty. XML
+    (going by the Content-Type, or the body if there is none) must parse,
+    HTML must end with a closing </html> tag, and JSON must be wrapped in
+    {} or []. Other bodies are only checked for length.
+
+    >>> validate_body({}, "<response><results></results></response>")
+    >>> validate_body({}, "<response><results></results>")
+    'not well-formed XML: no element found: line 1, column 29'
+    >>> validate_body({'content-type': 'text/html'}, "<html><body>Volume 1")
+    'HTML without a closing </html> tag'
+    """
+    # How much of the end of an HTML or JSON body is kept for checking
+    tail_size = 1024
+
+    def __init__(self, headers):
+        self.error = None
+        self.received = 0
+        self.kind = None
+        self.started = False
+        self.tail = ""
+        self.expected = headers.get('content-length')
+        contenttype = headers.get('content-type', '').lower()
+        for kind in ('xml', 'html', 'json'):
+            if kind in contenttype:
+                self.kind = kind
+                break
+        if 'gzip' in headers.get('content-encoding', ''):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.decompressor = None
+        self.parser = None
+
+    def _sniff(self, data):
+        """Picks the kind of body from its first characters, when the
+        Content-Type did not say
+        """
+        start = data.lstrip()[:15].lower()
+        if start.startswith("<!doctype html") or start.startswith("<html"):
+            self.kind = 'html'
+        elif start.startswith("<"):
+            self.kind = 'xml'
+        elif start[:1] in ("{", "["):
+            self.kind = 'json'
+
+    def feed(self, data):
+        """Checks the next chunk of the body
+        """
+        if self.error is not None or not data:
+            return
+        self.received += len(data)
+        try:
+            if self.decompressor is not None:
+                data = self.decompressor.decompress(data)
+            self._check(data)
+        except zlib.error, errormsg:
+            self.error = "corrupt gzip data: %s" % (errormsg)
+        except expat.ExpatError, errormsg:
+            self.error = "not well-formed XML: %s" % (errormsg)
+
+    def _check(self, data):
+        if not self.started:
+            if not data.strip():
+                return
+            self.started = True
+            if self.kind is None:
+                self._sniff(data)
+            if self.kind == 'xml':
+                self.parser = expat.ParserCreate()
+            elif self.kind == 'json' and data.lstrip()[:1] not in ("{", "["):
+                self.error = "JSON which is not an object or array"
+        if self.parser is not None:
+            self.parser.Parse(data, False)
+        elif self.kind in ('html', 'json'):
+            self.tail = (self.tail + data)[-self.tail_size:]
+
+    def finish(self):
+        """Returns why the body fails validation, or None if it passes,
+        once all of it has been fed
+        """
+        if self.error is None:
+            try:
+                if self.decompressor is not None:
+                    self._check(self.decompressor.flush())
+                if self.parser is not None:
+                    self.parser.Parse("", True)
+            except zlib.error, errormsg:
+                self.error = "corrupt gzip data: %s" % (errormsg)
+            except expat.ExpatError, errormsg:
+                self.error = "not well-formed XML: %s" % (errormsg)
+        if self.error is not None:
+            return self.error
+        if self.expected is not None and self.expected.isdigit() and int(self.expected) != self.received:
+            self.error = "%d bytes of a %s byte body" % (self.received, self.expected)
+        elif not self.started:
+            self.error = "empty body"
+        elif self.kind == 'html' and "</html>" not in self.tail.lower():
+            self.error = "HTML without a closing </html> tag"
+        elif self.kind == 'json' and self.tail.rstrip()[-1:] not in ("}", "]"):
+            self.error = "JSON which is not an object or array"
+        return self.error
 
 class CacheHandler(urllib2.BaseHandler):
     """Stores responses in a persistant on-disk cache.
 
     If a subsequent GET request is made for the same URL, the stored
-    response is returned, saving time, resources and bandwidth
+    response is returned, saving time, resources and bandwidth.
+
+    Once a response is older than max_age it is revalidated: if it had an
+    ETag or Last-Modified header, the request is sent with If-None-Match or
+    If-Modified-Since, and when the server answers 304 Not Modified the
+    stored response is kept (and is up-to-date for another max_age) without
+    downloading it again.
+
+    Requests with a "Cache-Control: no-cache" header skip the stored
+    response, and replace it with the downloaded one.
     """
     @locked_function
     def __init__(self, cache_location, max_age = 21600):
@@ -119,6 +337,9 @@ class CacheHandler(urllib2.BaseHandler):
         if request.get_method() is not "GET":
             return None # let the next handler try to handle the request
 
+        if 'no-cache' in request.get_header('Cache-control', ''):
+            return None # download it again
+
         if exists_in_cache(
             self.cache_location, request.get_full_url(), self.max_age
         ):
@@ -128,34 +349,242 @@ class CacheHandler(urllib2.BaseHandler):
                 set_cache_header = True
             )
         else:
+            # Stale (or missing), ask the server if it has changed
+            for name, value in cache_validators(
+                self.cache_location, request.get_full_url()
+            ).items():
+                request.add_unredirected_header(name, value)
             return None
 
     def http_response(self, request, response):
         """Gets a HTTP response, if it was a GET request and the status code
-        starts with 2 (200 OK etc) it caches it and returns a CachedResponse
+        starts with 2 (200 OK etc) it returns a TeeResponse, which caches it
+        as it is read (if it passes BodyValidator).
+        A 304 Not Modified to a revalidation returns the stored response
         """
         if (request.get_method() == "GET"
+            and response.code == httplib.NOT_MODIFIED
+            and (request.has_header('If-none-match')
+                or request.has_header('If-modified-since'))
+        ):
+            # Nothing to read, but lets a keep-alive connection be reused
+            response.read()
+            response.close()
+            refresh_in_cache(self.cache_location, request.get_full_url())
+            return CachedResponse(
+                self.cache_location,
+                request.get_full_url(),
+                set_cache_header = True
+            )
+        elif (request.get_method() == "GET"
             and str(response.code).startswith("2")
         ):
             if 'x-local-cache' not in response.info():
-                # Response is not cached
-                set_cache_header = store_in_cache(
+                # Response is not cached, store it as it is read
+                return TeeResponse(
                     self.cache_location,
                     request.get_full_url(),
                     response
                 )
             else:
-                set_cache_header = True
+                return CachedResponse(
+                    self.cache_location,
+                    request.get_full_url(),
+                    set_cache_header = True
+                )
             #end if x-cache in response
-
-            return CachedResponse(
-                self.cache_location,
-                request.get_full_url(),
-                set_cache_header = set_cache_header
-            )
         else:
             return response
 
+class NegativeCache(object):
+    """Remembers queries which found nothing, for ttl seconds.
+
+    Misses are always kept in memory. If location is given, they are also
+    stored on disk as empty [location]/[hash_of_key].miss files, so other
+    instances and processes sharing the location skip the same queries.
+    """
+    def __init__(self, ttl, location = None):
+        self.ttl = ttl
+        self.location = location
+        self.lock = RLock()
+        self.expiry = {}
+        if location is not None and not os.path.isdir(location):
+            try:
+                os.makedirs(location)
+            except OSError, e:
+                if e.errno != errno.EEXIST or not os.path.isdir(location):
+                    raise
+
+    def _path(self, key):
+        if isinstance(key, unicode):
+            key = key.encode("utf-8")
+        return os.path.join(self.location, md5(key).hexdigest() + ".miss")
+
+    def __contains__(self, key):
+        with self.lock:
+            expires = self.expiry.get(key)
+            if expires is not None:
+                if expires > time.time():
+                    return True
+                del self.expiry[key]
+        if self.location is not None:
+            path = self._path(key)
+            if check_cache_time(path, self.ttl):
+                with self.lock:
+                    self.expiry[key] = os.stat(path).st_mtime + self.ttl
+                return True
+        return False
+
+    def add(self, key):
+        """Records that key found nothing
+        """
+        with self.lock:
+            self.expiry[key] = time.time() + self.ttl
+        if self.location is not None:
+            try:
+                open(self._path(key), "w").close()
+            except IOError:
+                pass
+
+
+class TeeResponse(object):
+    """An urllib2.response-like object for responses from the network, which
+    copies the body into the cache as it is read, so it can be consumed
+    while it downloads. The cache entry is only written once the whole body
+    has been read, and only if it passes BodyValidator; a response closed
+    before then is not cached. After that, rejected is why the body failed
+    validation, or None.
+    """
+    def __init__(self, cache_location, url, response):
+        self.cache_location = cache_location
+        self.url = url
+        self.response = response
+        self.code = response.code
+        self.msg = response.msg
+        self.headers = response.info()
+        self.bodyhash = md5()
+        self.validator = BodyValidator(self.headers)
+        self.rejected = None
+        try:
+            fd, self.partpath = tempfile.mkstemp(suffix = ".part", dir = cache_location)
+        except (IOError, OSError):
+            self.partfile = None
+        else:
+            self.partfile = os.fdopen(fd, "wb")
+
+    def info(self):
+        """Returns headers
+        """
+        return self.headers
+
+    def geturl(self):
+        """Returns original URL
+        """
+        return self.url
+
+    def read(self, amt = -1):
+        if amt is None or amt < 0:
+            data = self.response.read()
+        else:
+            data = self.response.read(amt)
+        if self.partfile is not None:
+            try:
+                if data:
+                    self.partfile.write(data)
+                    self.bodyhash.update(data)
+                    self.validator.feed(data)
+            except (IOError, OSError):
+                self._discard()
+            else:
+                if not data or amt is None or amt < 0:
+                    self._commit()
+        return data
+
+    def _commit(self):
+        """Moves the fully read body into the cache, next to its headers,
+        unless it fails validation
+        """
+        self.rejected = self.validator.finish()
+        if self.rejected is not None:
+            self._discard()
+            return
+        partfile, self.partfile = self.partfile, None
+        try:
+            partfile.close()
+            _commit_entry(self.cache_location, self.url, self.partpath, self.headers, self.bodyhash)
+        except (IOError, OSError):
+            _remove(self.partpath)
+
+    def _discard(self):
+        if self.partfile is not None:
+            self.partfile.close()
+            self.partfile = None
+            _remove(self.partpath)
+
+    def close(self):
+        """Closes the response. A body which was not read to the end is
+        removed, not cached
+        """
+        try:
+            self._discard()
+        finally:
+            self.response.close()
+
+
+class ParsedCache(object):
+    """Second cache tier, holding what was extracted from cached responses
+    (in marshal format), so a warm lookup is one file read and one
+    marshal.loads instead of parsing the responses again.
+
+    Entries are keyed by URL and the md5 of the body they were extracted
+    from (see body_hash), so once the response changes they are no longer
+    used. Only builtin types (dicts, lists, strings, numbers, None) can be
+    stored.
+    """
+    def __init__(self, cache_location):
+        self.cache_location = cache_location
+
+    def _path(self, url, bodyhash):
+        if isinstance(url, unicode):
+            url = url.encode("utf-8")
+        return os.path.join(self.cache_location, md5(url + "\0" + bodyhash).hexdigest() + ".parsed")
+
+    def get(self, url, bodyhash):
+        """Returns the value stored for url and bodyhash, or None
+        """
+        try:
+            inf = open(self._path(url, bodyhash), "rb")
+            try:
+                return marshal.loads(inf.read())
+            finally:
+                inf.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            # Missing, or written by another version of Python
+            return None
+
+    def put(self, url, bodyhash, value):
+        """Stores value for url and bodyhash. Values marshal cannot store
+        are skipped
+        """
+        try:
+            data = marshal.dumps(value)
+        except ValueError:
+            return
+        path = self._path(url, bodyhash)
+        try:
+            fd, partpath = tempfile.mkstemp(suffix = ".part", dir = self.cache_location)
+        except (IOError, OSError):
+            return
+        try:
+            outf = os.fdopen(fd, "wb")
+            outf.write(data)
+            outf.close()
+            with cache_lock:
+                _replace(partpath, path)
+        except (IOError, OSError):
+            _remove(partpath)
+
+
 class CachedResponse(StringIO.StringIO):
     """An urllib2.response-like object for cached responses.
 
@@ -188,15 +617,28 @@ class CachedResponse(StringIO.StringIO):
         """
         return self.url
 
-    @locked_function
-    def recache(self):
-        new_request = urllib2.urlopen(self.url)
-        set_cache_header = store_in_cache(
-            self.cache_location,
-            new_request.url,
-            new_request
+    def recache(self, opener = None):
+        """Downloads the response again through opener (an urllib2 opener
+        with a CacheHandler for the same cache_location, by default one
+        with nothing else), replacing the cached one. A body which fails
+        validation is returned without being cached, and the cached
+        response is dropped
+        """
+        if opener is None:
+            opener = urllib2.build_opener(CacheHandler(self.cache_location))
+        new_request = opener.open(
+            urllib2.Request(self.url, headers = {'Cache-Control': 'no-cache'})
         )
-        CachedResponse.__init__(self, self.cache_location, self.url, True)
+        try:
+            body = new_request.read()
+        finally:
+            new_request.close()
+        if getattr(new_request, 'rejected', None) is None:
+            CachedResponse.__init__(self, self.cache_location, self.url, True)
+            return
+        discard_from_cache(self.cache_location, self.url)
+        StringIO.StringIO.__init__(self, body)
+        self.headers = new_request.info()
 
 
 if __name__ == "__main__":
@@ -24,57 +24,199 @@ import re
 import sys
 import urllib
 import urllib2
-import StringIO
+import urlparse
 import tempfile
 import warnings
+import time
+import zlib
+import Queue
 import logging
-import datetime
+import threading
 
 try:
     import xml.etree.cElementTree as ElementTree
 except ImportError:
     import xml.etree.ElementTree as ElementTree
 
+# Fastest JSON decoder available, for format = 'json'
 try:
-    import gzip
+    import ujson as json
 except ImportError:
-    gzip = None
+    try:
+        import simplejson as json
+    except ImportError:
+        import json
 
 
-from cache import CacheHandler
+from cache import CacheHandler, NegativeCache, ParsedCache, body_hash
+from transport import KeepAliveHandler
+from ratelimit import get_limiter, ThrottleHandler
+from breaker import BreakerHandler, CircuitBreakers
+from corrections import MemoryCorrections, SqliteCorrections
 
 from comicvine_ui import BaseUI, ConsoleUI
-from comicvine_exceptions import (comicvine_error, comicvine_userabort, comicvine_volumenotfound,
-    comicvine_issuenotfound, comicvine_attributenotfound)
-
-lastTimeout = None
+from comicvine_match import normalize_name, score_candidates
+from comicvine_exceptions import (comicvine_exception, comicvine_error, comicvine_userabort,
+    comicvine_volumenotfound, comicvine_issuenotfound, comicvine_attributenotfound)
 
 def log():
     return logging.getLogger("comicvine_api")
 
-def levenshtein_distance(first, second):
-    """Find the Levenshtein distance between two strings."""
-    if len(first) > len(second):
-        first, second = second, first
-    if len(second) == 0:
-        return len(first)
-    first_length = len(first) + 1
-    second_length = len(second) + 1
-    distance_matrix = [[0] * second_length for x in range(first_length)]
-    for i in range(first_length):
-       distance_matrix[i][0] = i
-    for j in range(second_length):
-       distance_matrix[0][j]=j
-    for i in xrange(1, first_length):
-        for j in range(1, second_length):
-            deletion = distance_matrix[i-1][j] + 1
-            insertion = distance_matrix[i][j-1] + 1
-            substitution = distance_matrix[i-1][j-1]
-            if first[i-1] != second[j-1]:
-                substitution += 1
-            distance_matrix[i][j] = min(insertion, deletion, substitution)
-    return distance_matrix[first_length-1][second_length-1]
-    
+def _parallel_map(func, items, workers):
+    """Calls func on each of items using at most workers threads, and
+    returns the results in the same order as items. If any call raised an
+    exception, the one for the earliest item is re-raised once all threads
+    have finished
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    pending = Queue.Queue()
+    for index, item in enumerate(items):
+        pending.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception:
+                errors.append((index, sys.exc_info()))
+    #end worker
+
+    threads = [threading.Thread(target = worker) for x in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        index, (exc_type, exc_value, exc_tb) = min(errors, key = lambda e: e[0])
+        raise exc_type, exc_value, exc_tb
+    return results
+
+class SingleFlight(object):
+    """Makes sure a call is only in progress once per key. Threads asking
+    for a key which is already being worked on wait for that call to finish
+    and share its result (or exception) instead of repeating it
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.issued = 0 # calls which ran func
+        self.coalesced = 0 # calls which waited for another's result
+
+    def stats(self):
+        """Returns a dict of the issued and coalesced call counts
+        """
+        return {'issued': self.issued, 'coalesced': self.coalesced}
+
+    def do(self, key, func, *args):
+        """Returns func(*args), unless a call for key is already in flight,
+        in which case it waits for and returns that call's result
+        """
+        self.lock.acquire()
+        try:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event()}
+                self.issued += 1
+            else:
+                self.coalesced += 1
+        finally:
+            self.lock.release()
+
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                exc_type, exc_value, exc_tb = call['error']
+                raise exc_type, exc_value, exc_tb
+            return call['result']
+
+        try:
+            call['result'] = func(*args)
+        except Exception:
+            call['error'] = sys.exc_info()
+            raise
+        finally:
+            self.lock.acquire()
+            try:
+                del self.calls[key]
+            finally:
+                self.lock.release()
+            call['done'].set()
+        return call['result']
+
+# SingleFlights for requests, by cache location, see url_flight
+_url_flights = {}
+_url_flights_lock = threading.Lock()
+
+def url_flight(cache_location):
+    """Returns the SingleFlight shared by the Comicvine instances caching
+    in cache_location, so concurrent requests for the same URL from any of
+    them are only sent once (the others then read the same cached
+    response). Instances without a cache should use their own SingleFlight
+    """
+    key = os.path.abspath(cache_location)
+    _url_flights_lock.acquire()
+    try:
+        if key not in _url_flights:
+            _url_flights[key] = SingleFlight()
+        return _url_flights[key]
+    finally:
+        _url_flights_lock.release()
+
+def _canonicalUrl(url):
+    """Returns url with the scheme and host lower-cased and the query
+    parameters sorted, so equivalent URLs compare equal
+    """
+    parts = urlparse.urlsplit(url)
+    query = "&".join(sorted(parts.query.split("&"))) if parts.query else ""
+    return urlparse.urlunsplit((
+        parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""
+    ))
+
+# Volume fields needed to load a volume's issues, always requested
+VOLUME_REQUIRED_FIELDS = ('id', 'name', 'site_detail_url', 'issues')
+
+def _jsonText(value):
+    """Returns a JSON value as the text of the equivalent XML element would
+    be: None for objects and lists, numbers as strings
+    """
+    if isinstance(value, (dict, list)):
+        return None
+    if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+        return unicode(value)
+    return value
+
+class _ChunkReader(object):
+    """File-like object reading from an iterator of strings, so a parser can
+    consume a body while the rest of it is still downloading
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+
+    def read(self, size = -1):
+        if size is None or size < 0:
+            data, self.buffer = self.buffer + "".join(self.chunks), ""
+            return data
+        while not self.buffer:
+            try:
+                self.buffer = self.chunks.next()
+            except StopIteration:
+                return ""
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
 class volumeContainer(dict):
     """Simple dict that holds a collection of volume instances
     """
@@ -86,6 +228,9 @@ class volume(dict):
     def __init__(self):
         dict.__init__(self)
         self.data = {}
+        # Set by Comicvine when only some fields were requested, called with
+        # the name of a missing field to fetch it
+        self.lazy_loader = None
 
     def __repr__(self):
         return "<volume %s (containing %s issues)>" % (
@@ -102,8 +247,15 @@ class volume(dict):
             # Non-numeric request is for volume-data
             return dict.__getitem__(self.data, key)
 
+        if (self.lazy_loader is not None and isinstance(key, basestring)
+                and not key.isdigit()):
+            # Field was left out by the projection, fetch it now
+            self.lazy_loader(key)
+            if key in self.data:
+                return dict.__getitem__(self.data, key)
+
         # Data wasn't found, raise appropriate error
-        if isinstance(key, int) or key.isdigit():
+        if isinstance(key, (int, float)) or key.isdigit():
             # Issue number x was not found
             raise comicvine_issuenotfound("Could not find issue %s" % (repr(key)))
         else:
@@ -253,7 +405,27 @@ class Comicvine:
                 credits = False,
                 custom_ui = None,
                 apikey = None,
-                forceConnect=False):
+                forceConnect=False,
+                page_size = 20,
+                workers = 4,
+                early_exit = False,
+                match_threshold = 0,
+                max_results = None,
+                corrections = None,
+                negative_cache = True,
+                negative_cache_ttl = 3600,
+                transport = None,
+                pool_size = 4,
+                timeout = 30,
+                rate_limit = None,
+                rate_burst = 5,
+                retries = 3,
+                circuit_breaker = True,
+                breaker_failure_rate = 0.5,
+                breaker_reset = 30,
+                format = 'xml',
+                fields = None,
+                parsed_cache = True):
         """interactive (True/False):
             When True, uses built-in console UI is used to select the correct volume.
             When False, the first search result is used.
@@ -292,21 +464,142 @@ class Comicvine:
             comicvine_api in a larger application)
             See http://comicvine.com/?tab=apiregister to get your own key
 
-        forceConnect (bool):
-            If true it will always try to connect to theTVDB.com even if we
-            recently timed out. By default it will wait one minute before
-            trying again, and any requests within that one minute window will
-            return an exception immediately. 
+        forceConnect (bool) DEPRECATED:
+            No longer has any effect. Network errors no longer block new
+            instances for a minute, see rate_limit instead.
+
+        page_size (int):
+            Number of results requested per page of volume search results.
+
+        workers (int):
+            Maximum number of requests made at the same time during a
+            single lookup (for example, fetching the remaining pages of
+            search results, or of a volume's site detail listing). 1
+            fetches everything one request at a time.
+
+        early_exit (True/False):
+            Stop paging through volume search results as soon as a result
+            scores match_threshold or better, instead of fetching every
+            page. Useful for batch jobs which only want the best match.
+
+        match_threshold (int):
+            Largest Levenshtein distance from the searched name which counts
+            as a good enough match for early_exit. 0 only stops on an exact
+            match.
+
+        max_results (int/None):
+            Stop paging through volume search results once this many have
+            been retrieved. None fetches every result.
+
+        corrections (None/str/unicode/corrections.CorrectionsStore):
+            Where to remember which volume each name resolved to. None keeps
+            them in memory for this instance only. If set to a str/unicode
+            instance, it is used as the path of an SQLite database, which
+            can be shared by any number of processes, so names resolved by
+            one are never searched for again by the others.
+
+        negative_cache (True/False/str/unicode):
+            Remember volume names which found nothing, so asking for them
+            again raises comicvine_volumenotfound straight away instead of
+            searching again. If True the misses are kept in memory, if set
+            to a str/unicode instance they are also stored in that folder,
+            and shared with anything else using it. If False, disables this.
+
+        negative_cache_ttl (int):
+            How long (in seconds) a volume name which found nothing is
+            remembered for.
+
+        transport (urllib2.HTTPHandler subclass instance):
+            Handler used for every request the cache cannot answer. By
+            default a transport.KeepAliveHandler is used, which keeps
+            connections open and reuses them for later requests to the
+            same host. transport.RecordHandler and transport.ReplayHandler
+            record responses to a directory and replay them offline.
+
+        pool_size (int):
+            Number of idle keep-alive connections the default transport
+            keeps open per host.
+
+        timeout (int/float):
+            Timeout (in seconds) for connecting to and reading from the
+            server, used by the default transport.
+
+        rate_limit (int/float/None):
+            Average number of requests per second to send to the server.
+            The limit is per API key, and shared by every Comicvine
+            instance (and thread) using the same key; if they ask for
+            different limits, the strictest applies. Every request is
+            paced, including the site detail pages, so a low limit slows
+            down lookups of long volumes. None (the default) sends requests
+            as they are made.
+            Either way, after a failed request further requests are held
+            back for an exponentially growing delay, and after a throttling
+            response (HTTP 429/503) for as long as the server asks.
+
+        rate_burst (int):
+            Number of requests which may be sent back to back before
+            rate_limit applies.
+
+        retries (int):
+            How many times a request which failed to connect or was
+            throttled is retried.
+
+        circuit_breaker (True/False/breaker.CircuitBreakers):
+            Keep track of failing requests separately for each endpoint
+            (search, volume, issue and the site detail pages). Once
+            breaker_failure_rate of the recent requests to one have failed,
+            requests to it raise comicvine_unavailable straight away for
+            breaker_reset seconds, instead of waiting on timeouts, while the
+            other endpoints and the cache keep working. A CircuitBreakers
+            instance can be given to share the breakers between instances.
+            The state and counters of each breaker are returned by
+            comicvine_instance.breakers.stats(). If False, disables this.
+
+        breaker_failure_rate (float):
+            Fraction (0 to 1) of recent requests to an endpoint which must
+            fail before its breaker opens.
+
+        breaker_reset (int/float):
+            How long (in seconds) a breaker stays open before a single
+            request is let through to see if the endpoint has recovered.
+
+        format ('xml'/'json'):
+            Format to ask the API for. 'json' is decoded with the fastest
+            JSON library installed (ujson, simplejson or json), and gives
+            the same volumes and issues as 'xml'.
+
+        fields (None/list of str):
+            Volume fields to request, passed to the API as its
+            field_list. The fields needed to load issues (id, name,
+            site_detail_url and issues) are always requested. Other fields
+            are fetched when first accessed:
+
+            >>> c = Comicvine(fields = ['publisher'])
+            >>> volume = c['Y: The Last Man']
+            >>> description = volume['description'] # A second, small request
+
+            None requests every field. Can be overridden for one lookup
+            with comicvine_instance.get(name, fields = [...]).
+
+        parsed_cache (True/False):
+            When caching is enabled, also store each loaded volume (its data
+            and issues) in the cache folder, keyed by the volume document's
+            URL and body. Loading it again while the cached volume document
+            is unchanged then reads it back in one go, without parsing the
+            volume document or the site detail pages.
         """
-        
-        global lastTimeout
-        
-        # if we're given a lastTimeout that is less than 1 min just give up
-        if not forceConnect and lastTimeout != None and datetime.datetime.now() - lastTimeout < datetime.timedelta(minutes=1):
-            raise comicvine_error("We recently timed out, so giving up early this time")
-        
+
         self.volume = volumeContainer() # Holds all volume classes
-        self.corrections = {} # Holds volume-name to volume_id mapping
+        self._loadedVolumes = set() # ids of volumes which are fully loaded
+        self._volumeFlight = SingleFlight()
+        self._volumeFields = {} # Fields requested for each projected volume
+        # Holds volume-name to volume_id mapping
+        if corrections is None:
+            self.corrections = MemoryCorrections()
+        elif isinstance(corrections, basestring):
+            self.corrections = SqliteCorrections(corrections)
+        else:
+            self.corrections = corrections
 
         self.config = {}
 
@@ -323,6 +616,16 @@ class Comicvine:
 
         self.config['select_first'] = select_first
 
+        self.config['page_size'] = page_size
+
+        self.config['workers'] = workers
+
+        self.config['early_exit'] = early_exit
+
+        self.config['match_threshold'] = match_threshold
+
+        self.config['max_results'] = max_results
+
         if cache is True:
             self.config['cache_enabled'] = True
             self.config['cache_location'] = self._getTempDir()
@@ -332,15 +635,61 @@ class Comicvine:
         else:
             self.config['cache_enabled'] = False
 
+        if transport is None:
+            transport = KeepAliveHandler(pool_size = pool_size, timeout = timeout)
+        self.transport = transport
+
+        # Backs off from failed and throttled requests even without a rate
+        self.limiter = get_limiter(self.config['apikey'], rate_limit, rate_burst)
+        transport = ThrottleHandler(transport, self.limiter, retries = retries)
+
+        if circuit_breaker is True:
+            self.breakers = CircuitBreakers(
+                failure_rate = breaker_failure_rate, reset_timeout = breaker_reset
+            )
+        elif circuit_breaker:
+            self.breakers = circuit_breaker
+        else:
+            self.breakers = None
+        if self.breakers is not None:
+            transport = BreakerHandler(transport, self.breakers)
+
+        self.config['timeout'] = timeout
+
+        self.config['retries'] = retries
+
         if self.config['cache_enabled']:
+            self.cachehandler = CacheHandler(self.config['cache_location'])
             self.urlopener = urllib2.build_opener(
-                CacheHandler(self.config['cache_location'])
+                self.cachehandler,
+                transport
             )
         else:
-            self.urlopener = urllib2.build_opener()
+            self.cachehandler = None
+            self.urlopener = urllib2.build_opener(transport)
+        # Responses are decompressed as they are read, see _iterBody
+        self.urlopener.addheaders.append(('Accept-Encoding', 'gzip'))
+
+        # Coalesces concurrent requests for the same URL, see _loadBody
+        if self.cachehandler is not None:
+            self.urlflight = url_flight(self.config['cache_location'])
+        else:
+            self.urlflight = SingleFlight()
+
+        if self.cachehandler is not None and parsed_cache:
+            self.parsedcache = ParsedCache(self.config['cache_location'])
+        else:
+            self.parsedcache = None
 
         self.config['credits_enabled'] = credits
 
+        if negative_cache is True:
+            self.negative_cache = NegativeCache(negative_cache_ttl)
+        elif isinstance(negative_cache, basestring):
+            self.negative_cache = NegativeCache(negative_cache_ttl, negative_cache)
+        else:
+            self.negative_cache = None
+
         if self.config['debug_enabled']:
             warnings.warn("The debug argument to comicvine_api.__init__ will be removed in the next version. "
             "To enable debug messages, use the following code before importing: "
@@ -351,11 +700,19 @@ class Comicvine:
         # http://comicvine.com/wiki/index.php/Programmers_API
         self.config['base_url'] = "http://api.comicvine.com"
 
-        self.config['url_getvolume'] = u"%(base_url)s/search/?api_key=%(apikey)s&query=%%s&resources=volume&offset=%%s&field_list=name,id" % self.config
+        if format not in ('xml', 'json'):
+            raise ValueError("format must be 'xml' or 'json', not %r" % (format))
+        self.config['format'] = format
+        # XML is the API's default, only JSON needs asking for
+        self.config['url_format'] = "&format=json" if format == 'json' else ""
 
-        self.config['url_issInfo'] = u"%(base_url)s/issue/%%s/?api_key=%(apikey)s" % self.config
+        self.config['url_getvolume'] = u"%(base_url)s/search/?api_key=%(apikey)s&query=%%s&resources=volume&limit=%%s&offset=%%s&field_list=name,id%(url_format)s" % self.config
 
-        self.config['url_volumeInfo'] = u"%(base_url)s/volume/%%s/?api_key=%(apikey)s" % self.config
+        self.config['fields'] = fields
+
+        self.config['url_issInfo'] = u"%(base_url)s/issue/%%s/?api_key=%(apikey)s%(url_format)s" % self.config
+
+        self.config['url_volumeInfo'] = u"%(base_url)s/volume/%%s/?api_key=%(apikey)s%(url_format)s" % self.config
 
         self.config['url_siteDetail'] = u"%%s?sort=issue_number&page=%%s" % self.config
 
@@ -367,61 +724,163 @@ class Comicvine:
         return os.path.join(tempfile.gettempdir(), "comicvine_api")
 
     def _loadUrl(self, url, recache = False):
-        global lastTimeout
+        """Returns the (decompressed) body of url. A body the cache rejects
+        (see cache.BodyValidator) is downloaded once more, and returned
+        uncached if that is rejected too
+        """
+        body, rejected = self._loadBody(url, recache)
+        if rejected is not None and not recache:
+            body, rejected = self._loadBody(url, recache = True)
+        return body
+
+    def _loadBody(self, url, recache = False):
+        """Returns (body of url, why the cache rejected it or None). Threads
+        asking for the same URL at the same time share one request, see
+        urlflight. recache downloads it again, on its own
+        """
+        if recache:
+            return self._fetchUrl(url, recache)
+        return self.urlflight.do(_canonicalUrl(url), self._fetchUrl, url)
+
+    def _fetchUrl(self, url, recache = False):
+        """Downloads url once, returns (body, why the cache rejected it or
+        None)
+        """
+        resp = self._openUrl(url, recache)
+        try:
+            body = "".join(self._iterBody(resp))
+        finally:
+            resp.close()
+        rejected = getattr(resp, 'rejected', None)
+        if rejected is not None:
+            log().warning("Response for %s was not cached, %s" % (url, rejected))
+        return body, rejected
+
+    def _openUrl(self, url, recache = False):
+        """Opens url using caching, returns the response
+        """
         try:
             log().debug("Retrieving URL %s" % url)
-            resp = self.urlopener.open(url)
+            if recache:
+                # Skips the cached copy, the download replaces it
+                log().debug("Attempting to recache %s" % url)
+                resp = self.urlopener.open(urllib2.Request(url, headers = {'Cache-Control': 'no-cache'}))
+            else:
+                resp = self.urlopener.open(url)
             if 'x-local-cache' in resp.headers:
                 log().debug("URL %s was cached in %s" % (
                     url,
                     resp.headers['x-local-cache'])
                 )
-                if recache:
-                    log().debug("Attempting to recache %s" % url)
-                    resp.recache()
         except (IOError, urllib2.URLError), errormsg:
-            if not str(errormsg).startswith('HTTP Error'):
-                lastTimeout = datetime.datetime.now()
             raise comicvine_error("Could not connect to server: %s" % (errormsg))
         #end try
-        
+        return resp
+
+    def _iterBody(self, resp, chunk_size = 16384):
+        """Yields the body of resp in chunks as they are read, decompressing
+        gzipped responses on the fly rather than after reading all of it
+        """
         # handle gzipped content,
         # http://dbr.lighthouseapp.com/projects/13342/tickets/72-gzipped-data-patch
         if 'gzip' in resp.headers.get("Content-Encoding", ''):
-            if gzip:
-                stream = StringIO.StringIO(resp.read())
-                gz = gzip.GzipFile(fileobj=stream)
-                return gz.read()
-            
-            raise comicvine_error("Received gzip data from comicvine.com, but could not correctly handle it")
-        
-        #print resp.read()
-        return resp.read()
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            decompressor = None
+
+        try:
+            while True:
+                chunk = resp.read(chunk_size)
+                if not chunk:
+                    break
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                if chunk:
+                    yield chunk
+            if decompressor is not None:
+                chunk = decompressor.flush()
+                if chunk:
+                    yield chunk
+        except zlib.error, errormsg:
+            raise comicvine_error("Received corrupt gzip data from comicvine.com: %s" % (errormsg))
+        except IOError, errormsg:
+            raise comicvine_error("Could not connect to server: %s" % (errormsg))
 
     def _getetsrc(self, url):
         """Loads a URL using caching, returns an ElementTree of the source
         """
-        src = self._loadUrl(url)
+        return self._loadParsed(url, ElementTree.fromstring)
+    #end _getetsrc
+
+    def _loadParsed(self, url, parse):
+        """Loads a URL using caching, returns parse(source). If the cache
+        rejected the source, or it is not valid XML (or JSON), it is
+        downloaded again and parsed once more
+        """
+        src, rejected = self._loadBody(url)
+        if rejected is None:
+            try:
+                return parse(src)
+            except (SyntaxError, ValueError):
+                pass
+        src, rejected = self._loadBody(url, recache=True)
         try:
-            return ElementTree.fromstring(src)
-        except SyntaxError:
-            src = self._loadUrl(url, recache=True)
+            return parse(src)
+        except (SyntaxError, ValueError), exceptionmsg:
+            raise comicvine_error(self._parseErrorMessage(exceptionmsg))
+
+    def _parseUrl(self, url, parse):
+        """Downloads url using caching and returns parse(source), source
+        being a file-like object which reads the (decompressed) body as it
+        arrives, so parsing overlaps the download. The body is stored in the
+        cache as it is read. If it does not parse, or the cache rejects it,
+        it is downloaded again and parsed once more.
+
+        Threads parsing the same URL at the same time share one request, see
+        urlflight. Those of this instance share its result, those of other
+        instances (sharing the cache location) parse the cached body after
+        """
+        # Keyed apart from _loadUrl, which shares bodies rather than results
+        owner, result = self.urlflight.do(('parsed', _canonicalUrl(url)),
+            lambda: (self, self._streamUrl(url, parse)))
+        if owner is self:
+            return result
+        return self._streamUrl(url, parse)
+
+    def _streamUrl(self, url, parse):
+        """Does the work of _parseUrl for one thread
+        """
+        for recache in (False, True):
+            resp = self._openUrl(url, recache)
             try:
-                return ElementTree.fromstring(src)
+                source = _ChunkReader(self._iterBody(resp))
+                result = parse(source)
+                # Whatever follows the document still has to reach the cache
+                source.read()
             except SyntaxError, exceptionmsg:
-                errormsg = "There was an error with the XML retrieved from comicvine.com:\n%s" % (
-                    exceptionmsg
-                )
+                continue
+            finally:
+                resp.close()
+            rejected = getattr(resp, 'rejected', None)
+            if rejected is None or recache:
+                return result
+            exceptionmsg = rejected
+            log().warning("Response for %s was not cached, %s" % (url, rejected))
+        raise comicvine_error(self._parseErrorMessage(exceptionmsg))
+
+    def _parseErrorMessage(self, exceptionmsg):
+        errormsg = "There was an error with the %s retrieved from comicvine.com:\n%s" % (
+            self.config['format'].upper(), exceptionmsg
+        )
 
-                if self.config['cache_enabled']:
-                    errormsg += "\nFirst try emptying the cache folder at..\n%s" % (
-                        self.config['cache_location']
-                    )
+        if self.config['cache_enabled']:
+            errormsg += "\nFirst try emptying the cache folder at..\n%s" % (
+                self.config['cache_location']
+            )
 
-                errormsg += "\nIf this does not resolve the issue, please try again later. If the error persists, report a bug on"
-                errormsg += "\nhttp://dbr.lighthouseapp.com/projects/13342-comicvine_api/overview\n"
-                raise comicvine_error(errormsg)
-    #end _getetsrc
+        errormsg += "\nIf this does not resolve the issue, please try again later. If the error persists, report a bug on"
+        errormsg += "\nhttp://dbr.lighthouseapp.com/projects/13342-comicvine_api/overview\n"
+        return errormsg
 
     def _setItem(self, sid, iss, attrib, value):
         """Creates a new issue, creating volume() and
@@ -465,41 +924,62 @@ class Comicvine:
     #end _cleanData
 
     def _getvolume(self, volumename):
-        """This searches TheTVDB.com for the volume name,
+        """This searches TheTVDB.com for the volume name (which should
+        already be normalized with comicvine_match.normalize_name),
         If a custom_ui UI is configured, it uses this to select the correct
         volume. If not, and interactive == True, ConsoleUI is used, if not
         BaseUI is used to select the first result.
         """
         print volumename
-        volumenameclean = urllib.quote(volumename.encode("utf-8"))
-        log().debug("Searching for volume %s" % volumenameclean)
-        
-        offset = -20
-        limit = 20
-        resultcount = 1
+        if self.negative_cache is not None and volumename in self.negative_cache:
+            log().debug('volume %s recently returned zero results' % (volumename))
+            raise comicvine_volumenotfound("volume-name search returned zero results (cannot find volume on Comic Vine)")
+
+        stop_early = self.config['early_exit'] or self.config['max_results'] is not None
+        if stop_early:
+            # Fetch a pool's worth of pages at a time, so paging can stop
+            # as soon as a good enough match turns up
+            pages = self._iterVolumePages(volumename, batch = self.config['workers'])
+        else:
+            pages = self._iterVolumePages(volumename)
+
         allvolume = []
-        
-        while (offset + limit < resultcount):
-	    	offset = offset + 20
-	    	volumeEt = self._getetsrc(self.config['url_getvolume'] % (volumenameclean, offset))
-	    	volumelist = volumeEt.findall("results/volume")
-	    	
-	    	for volume in volumelist:
-	    	    resultcount = resultcount + 1
-	    	    result = dict((k.tag.lower(), k.text) for k in volume.getchildren())
-	    	    result['id'] = int(result['id'])
-	    	    result['volumename'] = result['name']
-	    	    result['match_score'] = levenshtein_distance( volumename, result['volumename'] )
-	    	    log().debug('Found volume %(volumename)s' % result)
-	    	    allvolume.append(result)
-	    	#end for volume
-	    #end while
-        
+        for page in pages:
+            if stop_early:
+                self._scoreVolumes(volumename, page)
+            allvolume.extend(page)
+
+            if (self.config['max_results'] is not None
+                    and len(allvolume) >= self.config['max_results']):
+                log().debug('Stopping search after %d results' % len(allvolume))
+                del allvolume[self.config['max_results']:]
+                break
+            if self.config['early_exit'] and page and min(
+                    r['match_score'] for r in page) <= self.config['match_threshold']:
+                log().debug('Stopping search, found a close enough match')
+                break
+        #end for page
+        pages.close()
+
+        if not stop_early:
+            # Score every candidate in one pass, rather than one call per result
+            self._scoreVolumes(volumename, allvolume)
+
+        return self._selectvolume(volumename, allvolume)
+
+    #end _getvolume
+
+    def _selectvolume(self, volumename, allvolume):
+        """Sorts scored search results by match_score and passes them to the
+        configured UI, returning the volume it selects
+        """
         from operator import itemgetter
         allvolumeSorted = sorted(allvolume, key=itemgetter('match_score'))
-			
+
         if len(allvolume) == 0:
             log().debug('volume result returned zero')
+            if self.negative_cache is not None:
+                self.negative_cache.add(volumename)
             raise comicvine_volumenotfound("volume-name search returned zero results (cannot find volume on Comic Vine)")
 
         if self.config['custom_ui'] is not None:
@@ -516,8 +996,127 @@ class Comicvine:
         #end if custom_ui != None
 
         return ui.selectvolume(allvolumeSorted)
+    #end _selectvolume
 
-    #end _getvolume
+    def iter_search(self, name):
+        """Searches Comic Vine for volumes named name, yielding each result
+        as soon as the page it is on has been retrieved, rather than waiting
+        for every page. Results are dicts with the keys "id", "name",
+        "volumename" and "match_score" (the Levenshtein distance from name,
+        lower is better), in the order Comic Vine returns them.
+
+        Pages are fetched workers at a time, so only the pages a caller
+        actually iterates over (plus at most one batch) are requested:
+
+        >>> c = Comicvine()
+        >>> for result in c.iter_search('Y: The Last Man'):
+        ...     if result['match_score'] == 0:
+        ...         break
+        >>> result['volumename']
+        u'Y: The Last Man'
+        """
+        name = normalize_name(name)
+        pages = self._iterVolumePages(name, batch = self.config['workers'])
+        try:
+            for page in pages:
+                self._scoreVolumes(name, page)
+                for result in page:
+                    yield result
+        finally:
+            pages.close()
+    #end iter_search
+
+    def _iterVolumePages(self, volumename, batch = None):
+        """Yields each page of search results for volumename, as a list of
+        (unscored) volume dicts.
+
+        The first page says how many results there are in total. The
+        remaining pages are fetched together through the worker pool, or
+        batch pages at a time if batch is given, so a caller which stops
+        iterating early does not pay for the pages it never looked at.
+        """
+        log().debug("Searching for volume %s" % volumename)
+        limit = self.config['page_size']
+
+        def fetch(offset):
+            return self._loadParsed(self._searchUrl(volumename, offset), self._parseSearchPage)[0]
+
+        page, total = self._loadParsed(self._searchUrl(volumename, 0), self._parseSearchPage)
+        yield page
+
+        if total is not None:
+            offsets = range(limit, int(total), limit)
+            batch = batch or len(offsets) or 1
+            for start in range(0, len(offsets), batch):
+                for page in _parallel_map(fetch, offsets[start:start + batch],
+                        self.config['workers']):
+                    yield page
+        else:
+            # No total given, keep going until a page comes back short
+            offset = 0
+            while len(page) >= limit:
+                offset = offset + limit
+                page = fetch(offset)
+                yield page
+            #end while
+        #end if total
+    #end _iterVolumePages
+
+    def _searchUrl(self, volumename, offset):
+        """Returns the URL of the page of search results for volumename
+        starting at offset
+        """
+        volumenameclean = urllib.quote(volumename.encode("utf-8"))
+        return self.config['url_getvolume'] % (
+            volumenameclean, self.config['page_size'], offset
+        )
+
+    def _scoreVolumes(self, volumename, allvolume):
+        """Sets match_score on each volume dict, lower is a closer match.
+        volumename should already be normalized, the volume names are
+        normalized before comparing
+        """
+        scores = score_candidates(volumename,
+            [normalize_name(r['volumename'] or u"") for r in allvolume])
+        for result, score in zip(allvolume, scores):
+            result['match_score'] = score
+
+    def _parseSearchPage(self, src):
+        """Parses a page of search results, returning the list of volume
+        dicts on it and the total number of results (None if not given)
+        """
+        if self.config['format'] == 'json':
+            doc = json.loads(src)
+            return self._parseVolumeSearchJson(doc), doc.get('number_of_total_results')
+        volumeEt = ElementTree.fromstring(src)
+        return self._parseVolumeSearch(volumeEt), volumeEt.findtext('number_of_total_results')
+
+    def _parseVolumeSearchJson(self, doc):
+        """JSON version of _parseVolumeSearch, returning the same dicts
+        """
+        allvolume = []
+        for volume in doc.get('results') or []:
+            result = dict((k.lower(), _jsonText(v)) for k, v in volume.items())
+            result['id'] = int(result['id'])
+            result['volumename'] = result['name']
+            log().debug('Found volume %(volumename)s' % result)
+            allvolume.append(result)
+        #end for volume
+        return allvolume
+
+    def _parseVolumeSearch(self, volumeEt):
+        """Returns the list of volume dicts found on one page of search
+        results
+        """
+        allvolume = []
+        for volume in volumeEt.findall("results/volume"):
+            result = dict((k.tag.lower(), k.text) for k in volume.getchildren())
+            result['id'] = int(result['id'])
+            result['volumename'] = result['name']
+            log().debug('Found volume %(volumename)s' % result)
+            allvolume.append(result)
+        #end for volume
+        return allvolume
 
     def _parseCredits(self, sid, iid, creditsEt):
         """Parsers credits XML, from
@@ -553,108 +1152,390 @@ class Comicvine:
             cur_credits.append(curCredit)
         self._setItem(sid, iid, 'credits', cur_credits)
 
-    def _getvolumeData(self, sid):
+    def _getvolumeData(self, sid, fields = None):
         """Takes a volume ID, gets the issInfo URL and parses the TVDB
         XML file into the volume dict in layout:
         volume[volume_id][issue_number]
+
+        fields overrides the fields argument given to Comicvine
         """
 
         # Parse volume information
         log().debug('Getting all volume data for %s' % (sid))
-        volumeInfoEt = self._getetsrc(
-            self.config['url_volumeInfo'] % (sid)
+        fields = self._projection(fields)
+        siteDetailUrl, issueNames = self._getVolumeDocument(sid, fields)
+        if fields:
+            self._setProjection(sid, fields)
+
+        #Get issue details
+        log().debug('Getting all issues of %s' % (sid))
+
+        # Each page is scanned as it downloads. Page 1 says how many there
+        # are, the rest are fetched workers at a time and their issues added
+        # in page order
+        scan = lambda url: self._parseUrl(url, self._scanSiteDetail)
+        last, issues = scan(self.config['url_siteDetail'] % (siteDetailUrl, 1))
+        log().debug('Loading site detail pages 2 to %d' % (last))
+        pages = _parallel_map(
+            scan,
+            [self.config['url_siteDetail'] % (siteDetailUrl, page) for page in range(2, last + 1)],
+            self.config['workers']
         )
-        result = volumeInfoEt.findall("results")[0]
-        for curInfo in result:
-            tag = curInfo.tag.lower()
-            value = curInfo.text
 
-            #value = self._cleanData(value)
+        self._setSiteDetailIssues(sid, issues)
+        for pagelast, pageissues in pages:
+            self._setSiteDetailIssues(sid, pageissues)
+        self._parseIssueNames(sid, issueNames)
+    #end _getvolumeData
 
-            self._setvolumeData(sid, tag, value)
-        #end for volume
-        self._setvolumeData(sid, 'volumename', result.find('name').text)
+    def _projection(self, fields):
+        """Returns the set of fields to request for a volume, given the
+        fields argument of a lookup, or None for every field
+        """
+        if fields is None:
+            fields = self.config['fields']
+        if fields:
+            return set(fields) | set(VOLUME_REQUIRED_FIELDS)
+        return None
+
+    def _setProjection(self, sid, fields):
+        """Records that only fields were requested for volume sid, so the
+        others are fetched when first accessed
+        """
+        self._volumeFields[sid] = fields
+        self.volume[sid].lazy_loader = lambda key: self._loadVolumeFields(sid, [key])
 
-            
-        #Get issue details
-        log().debug('Getting all issues of %s' % (sid))
-        
-        page=1
-        siteDetailUrl=result.find('site_detail_url').text
-        siteDetailSrc = self._loadUrl( self.config['url_siteDetail'] % (siteDetailUrl, page) )
-        m = re.search('http://www.comicvine.com/(?P<volumeTag>.*)/49-',siteDetailUrl)
-        volumeTag=m.group('volumeTag')
-        
+    def _volumeUrl(self, sid, fields = None):
+        """Returns the URL of the volume document of sid, with only fields
+        in it if given
+        """
+        url = self.config['url_volumeInfo'] % (sid)
+        if fields:
+            url += "&field_list=%s" % ",".join(sorted(fields))
+        return url
+
+    def _getVolumeDocument(self, sid, fields = None):
+        """Loads and parses the volume document of sid (with only fields in
+        it if given), in the configured format.
+        Returns (site detail URL, {issue id: issue name})
+        """
+        url = self._volumeUrl(sid, fields)
+        if self.config['format'] == 'json':
+            return self._loadParsed(url, lambda src: self._parseVolumeJson(sid, json.loads(src)))
+        return self._parseUrl(url, lambda source: self._parseVolumeDocument(sid, source))
+
+    def _loadVolumeFields(self, sid, fields):
+        """Fetches the fields of a projected volume which were not requested
+        yet, in one request
+        """
+        requested = self._volumeFields.get(sid)
+        if requested is None:
+            # Every field was requested
+            return
+        missing = [f for f in fields if f not in requested]
+        if missing:
+            log().debug('Fetching fields %s of volume %s' % (", ".join(missing), sid))
+            requested.update(missing)
+            self._getVolumeDocument(sid, missing)
+
+    def _parseVolumeDocument(self, sid, source):
+        """Parses the volume document in the file-like source incrementally,
+        storing the fields of its results element as the volume data of sid.
+        Each field and issue element is dropped as soon as it has been read,
+        so the tree never holds more than one of them.
+        Returns (site detail URL, {issue id: issue name})
+        """
+        issueNames = {}
+        volumename = siteDetailUrl = results = None
+        path = [] # Elements from the root to the one being parsed
+        for event, elem in ElementTree.iterparse(source, events = ('start', 'end')):
+            if event == 'start':
+                if len(path) == 1 and elem.tag == 'results' and results is None:
+                    results = elem
+                path.append(elem)
+                continue
+            path.pop()
+            depth = len(path)
+            if depth == 3 and path[1] is results and path[2].tag == 'issues':
+                issueNames[int(elem.findtext('id'))] = elem.findtext('name')
+                path[2].remove(elem)
+            elif depth == 2 and path[1] is results:
+                tag = elem.tag.lower()
+                self._setvolumeData(sid, tag, elem.text)
+                if tag == 'name':
+                    volumename = elem.text
+                elif tag == 'site_detail_url':
+                    siteDetailUrl = elem.text
+                path[1].remove(elem)
+        #end for event, elem
+
+        if results is None:
+            raise comicvine_error("The volume document for %s has no results" % (sid))
+        if volumename is not None:
+            self._setvolumeData(sid, 'volumename', volumename)
+        return siteDetailUrl, issueNames
+
+    def _parseVolumeJson(self, sid, doc):
+        """JSON version of _parseVolumeDocument, storing the same volume
+        data. Returns (site detail URL, {issue id: issue name})
+        """
+        result = doc.get('results')
+        if not result:
+            raise comicvine_error("The volume document for %s has no results" % (sid))
+        for tag, value in result.items():
+            self._setvolumeData(sid, tag.lower(), _jsonText(value))
+        if result.get('name') is not None:
+            self._setvolumeData(sid, 'volumename', result['name'])
+        issueNames = dict(
+            (int(issue['id']), issue.get('name')) for issue in result.get('issues') or []
+        )
+        return result.get('site_detail_url'), issueNames
+
+    def _siteDetailLastPage(self, siteDetailSrc):
+        """Returns the number of site detail pages, read from the "Last"
+        link on the first one
+        """
         m = re.search('page=(?P<last>\d*)&amp;sort=issue_number\">Last</a>',siteDetailSrc)
         
         if m is not None:
-            last=int(m.group('last'))
+            return int(m.group('last'))
         else:
-            last=1
+            return 1
+
+    def _parseSiteDetail(self, sid, siteDetailSrc):
+        """Creates an Issue for every issue listed on the site detail pages
+        """
+        self._setSiteDetailIssues(sid, self._siteDetailIssues(siteDetailSrc))
 
-        while (page < last):
-            page = page + 1
-            log().debug('Loading site detail page %d' % (page))
-            siteDetailSrc = siteDetailSrc + self._loadUrl( self.config['url_siteDetail'] % (siteDetailUrl, page) )
-            
+    def _siteDetailIssues(self, siteDetailSrc):
+        """Returns [(issue number, issue id)] for the issues listed in
+        siteDetailSrc
+        """
+        issues = []
         for m in re.finditer('(?ms)<div class=\"comic-container">.*?/37-(?P<iss_id>\d*)/.*?<span class=\"issue\">Issue #(?P<iss_no>\d*)</span>.*?</div>',siteDetailSrc):
-            iss_id = int(m.group('iss_id'))
-            iss_no = float(m.group('iss_no'))
+            issues.append((float(m.group('iss_no')), int(m.group('iss_id'))))
+        return issues
 
+    def _setSiteDetailIssues(self, sid, issues):
+        """Creates an Issue for each (issue number, issue id) in issues
+        """
+        for iss_no, iss_id in issues:
             self._setItem(sid, iss_no, 'id', iss_id)
             self._setItem(sid, iss_no, 'issue_number', iss_no)
-                
+
             # Parse credits
             #if self.config['credits_enabled']:
             #    self._parseCredits(sid, iss_no, issueresult.find('person_credits'))
         #end for cur_iss
-        
-        issues=result.find('issues')
-        for curIssue in issues:
-          iss_id=int(curIssue.find('id').text)
-          log().debug('iss_id: %d, sid: %d' % (iss_id, sid))
-          issue_datas = self.volume[sid].search(iss_id, key='id')
-          log().debug(str(issue_datas))
-          if (len(issue_datas) > 0):
-              iss_no=issue_datas[0]['issue_number']
-              self._setItem(sid, iss_no, 'issuename', curIssue.find('name').text)
-    #end _getvolumeData
 
-    def _nameToSid(self, name):
+    def _scanSiteDetail(self, source, chunk_size = 16384):
+        """Scans the site detail page in the file-like source as it is
+        read. Only the text from the last issue container on is held back
+        until more arrives, so the page is never held whole.
+        Returns (number of pages, [(issue number, issue id)])
+        """
+        last = 1
+        issues = []
+        held = ""
+        while True:
+            chunk = source.read(chunk_size)
+            held += chunk
+            if chunk:
+                # Containers before the last one are complete
+                cut = held.rfind('<div class="comic-container">')
+            else:
+                cut = len(held)
+            if cut > 0:
+                scanned, held = held[:cut], held[cut:]
+                last = max(last, self._siteDetailLastPage(scanned))
+                issues.extend(self._siteDetailIssues(scanned))
+            if not chunk:
+                return last, issues
+
+    def _parseIssueNames(self, sid, issueNames):
+        """Sets the issuename of each Issue from issueNames, which maps
+        issue ids to names (see _parseVolumeDocument)
+        """
+        if sid not in self.volume:
+            return
+        for iss_no, iss in self.volume[sid].items():
+            if iss.get('id') in issueNames:
+                self._setItem(sid, iss_no, 'issuename', issueNames[iss['id']])
+
+    def _loadVolume(self, sid, fields = None):
+        """Makes sure all the data for volume sid is loaded. Volumes already
+        loaded (under any name, or by id) are reused, and concurrent calls
+        for the same id only load it once. fields overrides the fields
+        argument given to Comicvine
+        """
+        if sid not in self._loadedVolumes:
+            self._volumeFlight.do(sid, self._loadVolumeOnce, sid, fields)
+        elif fields:
+            self._loadVolumeFields(sid, fields)
+
+    def _loadVolumeOnce(self, sid, fields = None):
+        if sid not in self._loadedVolumes:
+            if not self._restoreVolume(sid, fields):
+                self._getvolumeData(sid, fields)
+                self._storeVolume(sid, fields)
+            self._loadedVolumes.add(sid)
+
+    def _parsedCacheKey(self, sid, fields):
+        """Returns (url, body hash) identifying volume sid in the parsed
+        cache, or None if its volume document is not in the cache
+        """
+        if self.parsedcache is None:
+            return None
+        url = self._volumeUrl(sid, self._projection(fields))
+        bodyhash = body_hash(self.config['cache_location'], url, self.cachehandler.max_age)
+        if bodyhash is None:
+            return None
+        return url, bodyhash
+
+    def _restoreVolume(self, sid, fields = None):
+        """Loads volume sid from the parsed cache, returns True if it was
+        there
+        """
+        key = self._parsedCacheKey(sid, fields)
+        stored = key and self.parsedcache.get(*key)
+        if not stored:
+            return False
+        log().debug('Volume %s was in the parsed cache' % (sid))
+        if sid not in self.volume:
+            self.volume[sid] = volume()
+        for name, value in stored['data'].items():
+            self._setvolumeData(sid, name, value)
+        for iss_no, issue in stored['issues']:
+            for attrib, value in issue.items():
+                self._setItem(sid, iss_no, attrib, value)
+        if stored['fields'] is not None:
+            self._setProjection(sid, set(stored['fields']))
+        return True
+
+    def _storeVolume(self, sid, fields = None):
+        """Stores the loaded volume sid in the parsed cache
+        """
+        key = self._parsedCacheKey(sid, fields)
+        if key is None or sid not in self.volume:
+            return
+        projection = self._volumeFields.get(sid)
+        self.parsedcache.put(key[0], key[1], {
+            'data': self.volume[sid].data,
+            'issues': [(iss_no, dict(issue)) for iss_no, issue in self.volume[sid].items()],
+            'fields': sorted(projection) if projection is not None else None,
+        })
+
+    def _nameToSid(self, name, fields = None):
         """Takes volume name, returns the correct volume ID (if the volume has
         already been grabbed), or grabs all issues and returns
         the correct SID.
         """
-        if name in self.corrections:
-            log().debug('Correcting %s to %s' % (name, self.corrections[name]) )
-            sid = self.corrections[name]
+        correction = self.corrections.get(name)
+        if correction is not None:
+            sid = correction['id']
+            log().debug('Correcting %s to %s' % (name, sid) )
+            # May have been resolved by an earlier instance (or process)
+            # sharing the corrections store
+            self._loadVolume(sid, fields)
         else:
             log().debug('Getting volume %s' % (name))
             selected_volume = self._getvolume( name )
             sname, sid = selected_volume['volumename'], selected_volume['id']
             log().debug('Got %(volumename)s, id %(id)s' % selected_volume)
 
-            self.corrections[name] = sid
-            self._getvolumeData(selected_volume['id'])
+            self.corrections.record(name, sid, selected_volume.get('match_score'))
+            self._loadVolume(sid, fields)
         #end if name in self.corrections
         return sid
     #end _nameToSid
 
+    def prefetch(self, names_or_ids, workers = None):
+        """Resolves and loads many volume names and/or volume ids at once,
+        using up to workers threads (by default the workers argument given
+        to Comicvine). Names are normalized first, and each distinct name
+        or id is only looked up once. Afterwards the volumes are available
+        through comicvine_instance[name] without further requests.
+
+        Meant for non-interactive use, as several volumes may be selected at
+        the same time.
+
+        Errors for one name do not stop the others. Returns a summary dict:
+
+        - loaded: maps each name or id which resolved to its volume id
+        - errors: maps each name or id which failed to the exception raised
+        - timings: maps each name or id to the seconds its lookup took
+        - elapsed: seconds taken for the whole prefetch
+        - workers: number of threads used
+
+        >>> c = Comicvine()
+        >>> summary = c.prefetch(['Y: The Last Man', 'y the last man', 'Fables'])
+        >>> sorted(summary['loaded'].items())
+        [(u'fables', 6223), (u'y the last man', 18122)]
+        """
+        if workers is None:
+            workers = self.config['workers']
+
+        keys = []
+        seen = set()
+        for item in names_or_ids:
+            if not isinstance(item, (int, long)):
+                item = normalize_name(item)
+            if item not in seen:
+                seen.add(item)
+                keys.append(item)
+
+        def resolve(key):
+            start = time.time()
+            try:
+                if isinstance(key, (int, long)):
+                    self._loadVolume(key)
+                    sid = key
+                else:
+                    sid = self._nameToSid(key)
+            except comicvine_exception, errormsg:
+                log().debug('Prefetching %s failed: %s' % (key, errormsg))
+                return key, None, errormsg, time.time() - start
+            return key, sid, None, time.time() - start
+
+        summary = {'loaded': {}, 'errors': {}, 'timings': {}, 'workers': workers}
+        start = time.time()
+        for key, sid, error, seconds in _parallel_map(resolve, keys, workers):
+            summary['timings'][key] = seconds
+            if error is None:
+                summary['loaded'][key] = sid
+            else:
+                summary['errors'][key] = error
+        summary['elapsed'] = time.time() - start
+        return summary
+    #end prefetch
+
     def __getitem__(self, key):
         """Handles comicvine_instance['volumename'] calls.
         The dict index should be the volume id
         """
+        return self.get(key)
+    #end __getitem__
+
+    def get(self, key, fields = None):
+        """Returns the volume for a volume name or id, like
+        comicvine_instance[key]. fields overrides the fields argument given
+        to Comicvine for this lookup:
+
+        >>> c = Comicvine()
+        >>> c.get('Y: The Last Man', fields = ['publisher'])['publisher']
+        u'...'
+        """
         if isinstance(key, (int, long)):
             # Item is integer, treat as volume id
-            if key not in self.volume:
-                self._getvolumeData(key)
+            self._loadVolume(key, fields)
             return self.volume[key]
         
-        key = key.lower() # make key lower case
-        sid = self._nameToSid(key)
+        # Equivalent spellings share corrections, search URLs and cache files
+        key = normalize_name(key)
+        sid = self._nameToSid(key, fields)
         log().debug('Got volume id %s' % (sid))
         return self.volume[sid]
-    #end __getitem__
+    #end get
 
     def __repr__(self):
         return str(self.volume)
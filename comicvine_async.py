@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""asyncio interface to Comic Vine's API, for use inside an event loop.
+
+Requires trollius (asyncio for Python 2). AsyncComicvine takes the same
+arguments as comicvine_api.Comicvine and shares its parsing, ranking,
+corrections and on-disk cache layout, but its lookups are coroutines:
+search pages and site detail pages are fetched concurrently on the event
+loop instead of blocking a thread.
+
+>>> import trollius as asyncio
+>>> from trollius import From, Return
+>>> from comicvine_async import AsyncComicvine
+>>> c = AsyncComicvine()
+>>> @asyncio.coroutine
+... def first_issue_name(name):
+...     volume = yield From(c[name])
+...     raise Return(volume[1]['issuename'])
+>>> asyncio.get_event_loop().run_until_complete(first_issue_name('Y: The Last Man'))
+u'Unmanned'
+"""
+
+__author__ = "swc/Steve"
+__version__ = "1.00"
+
+import zlib
+import httplib
+import urlparse
+import StringIO
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+except ImportError:
+    asyncio = None
+
+from cache import exists_in_cache, store_in_cache, validate_body, CachedResponse
+from ratelimit import retry_after, ThrottleHandler
+from comicvine_api import Comicvine, log, json
+from comicvine_match import normalize_name
+from comicvine_exceptions import comicvine_error, comicvine_volumenotfound
+
+if asyncio is not None:
+    coroutine = asyncio.coroutine
+else:
+    def coroutine(func):
+        return func
+
+
+class _Response(StringIO.StringIO):
+    """Response-like object for a downloaded body, as store_in_cache expects
+    """
+    def __init__(self, headers, body):
+        StringIO.StringIO.__init__(self, body)
+        self.headers = headers
+
+    def info(self):
+        return self.headers
+
+
+class AsyncComicvine(Comicvine):
+    """Comicvine whose lookups are coroutines. c[name] and c[volume_id]
+    return coroutines, which finish with the volume:
+
+        volume = yield From(c['Y: The Last Man'])
+
+    The workers argument limits how many requests are in flight at once.
+    early_exit is not used, every page of search results is fetched at the
+    same time.
+    """
+    def __init__(self, loop = None, **kwargs):
+        """loop is the event loop to use, by default the current one. All
+        other arguments are the same as for Comicvine
+        """
+        if asyncio is None:
+            raise comicvine_error("AsyncComicvine requires trollius (asyncio for Python 2)")
+        Comicvine.__init__(self, **kwargs)
+        self.loop = loop or asyncio.get_event_loop()
+        self.requestslots = asyncio.Semaphore(max(1, self.config['workers']), loop = self.loop)
+        self._volumeTasks = {}
+
+    @coroutine
+    def _httpGet(self, url):
+        """Downloads url, returning (status, headers, body)
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "http":
+            raise comicvine_error("Cannot fetch %s, only http is supported" % (url))
+        selector = parts.path or "/"
+        if parts.query:
+            selector += "?" + parts.query
+
+        reader, writer = yield From(asyncio.open_connection(
+            parts.hostname, parts.port or 80, loop = self.loop
+        ))
+        try:
+            request = (
+                "GET %s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n"
+                "Accept-Encoding: gzip\r\nUser-Agent: comicvine_api\r\n\r\n" % (selector, parts.netloc)
+            )
+            writer.write(request.encode("utf-8"))
+            raw = yield From(reader.read())
+        finally:
+            writer.close()
+
+        head, sep, body = raw.partition("\r\n\r\n")
+        statusline, sep, headertext = head.partition("\r\n")
+        try:
+            status = int(statusline.split(None, 2)[1])
+        except (IndexError, ValueError):
+            raise comicvine_error("Bad HTTP response from %s" % (url))
+        headers = httplib.HTTPMessage(StringIO.StringIO(headertext + "\r\n"))
+        if 'chunked' in headers.get('Transfer-Encoding', ''):
+            body = self._dechunk(body)
+            del headers['Transfer-Encoding']
+        raise Return((status, headers, body))
+
+    def _dechunk(self, body):
+        """Decodes a chunked transfer-encoded body
+        """
+        chunks = []
+        while body:
+            size, sep, body = body.partition("\r\n")
+            size = int(size.split(";")[0], 16)
+            if size == 0:
+                break
+            chunks.append(body[:size])
+            body = body[size + 2:]
+        return "".join(chunks)
+
+    @coroutine
+    def _throttledGet(self, url):
+        """Downloads url through the request slots and the rate limiter,
+        retrying failed and throttled requests like ThrottleHandler
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.limiter is not None:
+                wait = self.limiter.reserve()
+                while wait:
+                    yield From(asyncio.sleep(wait, loop = self.loop))
+                    wait = self.limiter.reserve()
+
+            yield From(self.requestslots.acquire())
+            try:
+                status, headers, body = yield From(asyncio.wait_for(
+                    self._httpGet(url), self.config['timeout'], loop = self.loop
+                ))
+            except (EnvironmentError, asyncio.TimeoutError), errormsg:
+                if self.limiter is not None:
+                    self.limiter.failure()
+                    if attempt <= self.config['retries']:
+                        continue
+                raise comicvine_error("Could not connect to server: %s" % (errormsg or "timed out"))
+            finally:
+                self.requestslots.release()
+
+            if self.limiter is not None:
+                if status in ThrottleHandler.throttle_codes:
+                    self.limiter.throttled(retry_after(_Response(headers, body)))
+                    if attempt <= self.config['retries']:
+                        continue
+                elif status >= 500:
+                    self.limiter.failure()
+                else:
+                    self.limiter.success()
+            raise Return((status, headers, body))
+
+    @coroutine
+    def _guardedGet(self, url):
+        """Downloads url through the circuit breaker for its endpoint
+        """
+        log().debug("Retrieving URL %s" % url)
+        if self.breakers is None:
+            result = yield From(self._throttledGet(url))
+            raise Return(result)
+        breaker = self.breakers.for_url(url)
+        breaker.before()
+        try:
+            status, headers, body = yield From(self._throttledGet(url))
+        except Exception:
+            breaker.failure()
+            raise
+        if status >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        raise Return((status, headers, body))
+
+    @coroutine
+    def _loadUrlAsync(self, url):
+        """Coroutine version of _loadUrl, reading from and storing in the
+        same disk cache. Like CacheHandler, bodies which fail validation
+        are not stored, and are downloaded once more
+        """
+        location = self.config.get('cache_location')
+        if (self.cachehandler is not None
+                and exists_in_cache(location, url, self.cachehandler.max_age)):
+            log().debug("URL %s was cached" % url)
+            resp = CachedResponse(location, url)
+            headers, body = resp.info(), resp.read()
+        else:
+            for attempt in range(2):
+                status, headers, body = yield From(self._guardedGet(url))
+                if not 200 <= status < 300:
+                    raise comicvine_error("Could not connect to server: HTTP Error %s" % (status))
+                if self.cachehandler is None:
+                    break
+                rejected = validate_body(headers, body)
+                if rejected is None:
+                    store_in_cache(location, url, _Response(headers, body))
+                    break
+                log().warning("Response for %s was not cached, %s" % (url, rejected))
+
+        if 'gzip' in headers.get("Content-Encoding", ''):
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        raise Return(body)
+
+    @coroutine
+    def _loadParsedAsync(self, url, parse):
+        """Coroutine version of _loadParsed, finishing with parse(source)
+        """
+        src = yield From(self._loadUrlAsync(url))
+        try:
+            raise Return(parse(src))
+        except (SyntaxError, ValueError), exceptionmsg:
+            raise comicvine_error(self._parseErrorMessage(exceptionmsg))
+
+    @coroutine
+    def search(self, name):
+        """Searches for volumes named name, finishing with every result
+        sorted by match_score (closest match first)
+        """
+        name = normalize_name(name)
+        allvolume, total = yield From(self._loadParsedAsync(
+            self._searchUrl(name, 0), self._parseSearchPage
+        ))
+        limit = self.config['page_size']
+
+        if total is not None:
+            total = int(total)
+            if self.config['max_results'] is not None:
+                total = min(total, self.config['max_results'])
+            pages = yield From(asyncio.gather(*[
+                self._loadParsedAsync(self._searchUrl(name, offset), self._parseSearchPage)
+                for offset in range(limit, total, limit)
+            ], loop = self.loop))
+            for page, pagetotal in pages:
+                allvolume.extend(page)
+        else:
+            page = allvolume
+            while len(page) >= limit:
+                page, pagetotal = yield From(self._loadParsedAsync(
+                    self._searchUrl(name, len(allvolume)), self._parseSearchPage
+                ))
+                allvolume.extend(page)
+
+        if self.config['max_results'] is not None:
+            del allvolume[self.config['max_results']:]
+        self._scoreVolumes(name, allvolume)
+        raise Return(sorted(allvolume, key = lambda r: r['match_score']))
+
+    @coroutine
+    def _getvolumeAsync(self, volumename):
+        """Coroutine version of _getvolume
+        """
+        if self.negative_cache is not None and volumename in self.negative_cache:
+            raise comicvine_volumenotfound("volume-name search returned zero results (cannot find volume on Comic Vine)")
+        allvolume = yield From(self.search(volumename))
+        raise Return(self._selectvolume(volumename, allvolume))
+
+    @coroutine
+    def _getvolumeDataAsync(self, sid, fields = None):
+        """Coroutine version of _getvolumeData. Site detail pages after the
+        first are fetched concurrently. Fields left out by a projection are
+        still fetched lazily, but not asynchronously
+        """
+        log().debug('Getting all volume data for %s' % (sid))
+        fields = self._projection(fields)
+        if self.config['format'] == 'json':
+            parse = lambda src: self._parseVolumeJson(sid, json.loads(src))
+        else:
+            parse = lambda src: self._parseVolumeDocument(sid, StringIO.StringIO(src))
+        siteDetailUrl, issueNames = yield From(self._loadParsedAsync(
+            self._volumeUrl(sid, fields), parse
+        ))
+        if fields:
+            self._setProjection(sid, fields)
+
+        last, issues = yield From(self._scanSiteDetailAsync(
+            self.config['url_siteDetail'] % (siteDetailUrl, 1)
+        ))
+        pages = yield From(asyncio.gather(*[
+            self._scanSiteDetailAsync(self.config['url_siteDetail'] % (siteDetailUrl, page))
+            for page in range(2, last + 1)
+        ], loop = self.loop))
+
+        self._setSiteDetailIssues(sid, issues)
+        for pagelast, pageissues in pages:
+            self._setSiteDetailIssues(sid, pageissues)
+        self._parseIssueNames(sid, issueNames)
+
+    @coroutine
+    def _scanSiteDetailAsync(self, url):
+        """Loads one site detail page and scans it as soon as it arrives,
+        returning (number of pages, [(issue number, issue id)])
+        """
+        src = yield From(self._loadUrlAsync(url))
+        raise Return((self._siteDetailLastPage(src), self._siteDetailIssues(src)))
+
+    @coroutine
+    def _loadVolumeAsync(self, sid, fields = None):
+        """Coroutine version of _loadVolume. Concurrent loads of the same id
+        wait on one task
+        """
+        if sid in self._loadedVolumes:
+            return
+        task = self._volumeTasks.get(sid)
+        if task is None and self._restoreVolume(sid, fields):
+            self._loadedVolumes.add(sid)
+        elif task is None:
+            task = asyncio.ensure_future(self._getvolumeDataAsync(sid, fields), loop = self.loop)
+            self._volumeTasks[sid] = task
+            try:
+                yield From(task)
+                self._storeVolume(sid, fields)
+                self._loadedVolumes.add(sid)
+            finally:
+                del self._volumeTasks[sid]
+        else:
+            yield From(asyncio.shield(task, loop = self.loop))
+
+    @coroutine
+    def get(self, key, fields = None):
+        """Coroutine version of Comicvine.get, finishing with the volume for
+        a volume name or id
+        """
+        if isinstance(key, (int, long)):
+            yield From(self._loadVolumeAsync(key, fields))
+            raise Return(self.volume[key])
+
+        key = normalize_name(key)
+        correction = self.corrections.get(key)
+        if correction is not None:
+            sid = correction['id']
+        else:
+            selected_volume = yield From(self._getvolumeAsync(key))
+            sid = selected_volume['id']
+            self.corrections.record(key, sid, selected_volume.get('match_score'))
+        yield From(self._loadVolumeAsync(sid, fields))
+        raise Return(self.volume[sid])
+
+    def __getitem__(self, key):
+        return self.get(key)
@@ -13,7 +13,7 @@ Modified from http://github.com/dbr/tvdb_api
 __author__ = "swc/Steve"
 __version__ = "1.01"
 
-__all__ = ["comicvine_error", "comicvine_userabort", "comicvine_volumenotfound", "comicvine_issuenotfound", "comicvine_attributenotfound"]
+__all__ = ["comicvine_error", "comicvine_unavailable", "comicvine_userabort", "comicvine_volumenotfound", "comicvine_issuenotfound", "comicvine_attributenotfound"]
 
 class comicvine_exception(Exception):
     """Any exception generated by comicvine_api
@@ -25,6 +25,12 @@ class comicvine_error(comicvine_exception):
     """
     pass
 
+class comicvine_unavailable(comicvine_error):
+    """Requests to a part of www.comicvine.com have been failing, so the
+    request was not attempted (see breaker.py)
+    """
+    pass
+
 class comicvine_userabort(comicvine_exception):
     """User aborted the interactive selection (via
     the q command, ^c etc)
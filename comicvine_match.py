@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Name matching helpers used to rank Comic Vine search results.
+
+levenshtein_distance uses a bit-parallel algorithm (Myers, 1999) when the
+shorter string fits in a machine word, and a banded dynamic programming
+algorithm otherwise. Both accept an optional max_distance cutoff, in which
+case any distance above the cutoff is reported as max_distance + 1:
+
+>>> levenshtein_distance('Y: The Last Man', 'Y: The Last Man')
+0
+>>> levenshtein_distance('kitten', 'sitting')
+3
+>>> levenshtein_distance('Batman', 'Detective Comics', max_distance = 4)
+5
+
+score_candidates scores a whole list of search results against one query.
+When NumPy is installed (and there are enough of them) the candidates are
+scored together, one character column at a time, otherwise it falls back to
+levenshtein_distance:
+
+>>> score_candidates('fables', ['Fables', 'Jack of Fables', 'fables'])
+[1, 8, 0]
+
+normalize_name folds the different ways of writing the same volume name
+into one form, which is used for lookups, search URLs and scoring:
+
+>>> normalize_name(u"Y: The Last Man")
+u'y the last man'
+>>> normalize_name(u"  Y - The Last Man ")
+u'y the last man'
+>>> normalize_name(u"The Walking Dead")
+u'walking dead'
+>>> normalize_name(u"A-Force")
+u'a force'
+>>> normalize_name(u"Pok\xe9mon Adventures")
+u'pokemon adventures'
+"""
+
+__author__ = "swc/Steve"
+__version__ = "1.00"
+
+import re
+import sys
+import unicodedata
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Longest pattern handled by the bit-parallel algorithm
+WORD_BITS = 64
+
+# Below this many candidates NumPy's per-call overhead outweighs the gain
+NUMPY_MIN_CANDIDATES = 200
+
+# Words dropped from the start of a name
+LEADING_ARTICLES = (u"the", u"a", u"an")
+
+_apostrophes = re.compile(u"['\u2018\u2019`]")
+_punctuation = re.compile(r"[\W_]+", re.UNICODE)
+# A leading article is a whole word, "A-Force" and "A.B.C. Warriors" keep theirs
+_leading_article = re.compile(r"\s*(?:%s)\s" % "|".join(LEADING_ARTICLES), re.UNICODE)
+
+def normalize_name(name):
+    """Returns name folded to lower case, with accents, apostrophes and a
+    leading article (followed by whitespace) removed, and other punctuation
+    and whitespace collapsed to single spaces
+    """
+    if isinstance(name, str):
+        name = name.decode("utf-8", "replace")
+    name = unicodedata.normalize("NFKD", name)
+    name = u"".join(c for c in name if not unicodedata.combining(c))
+    name = _apostrophes.sub(u"", name.lower())
+    words = _punctuation.sub(u" ", name).split()
+    if len(words) > 1 and _leading_article.match(name):
+        del words[0]
+    return u" ".join(words)
+
+def _myers_distance(pattern, text, max_distance = None):
+    """Bit-parallel edit distance. pattern must not be longer than WORD_BITS
+    (or the bit vectors stop being a single machine word)
+    """
+    m = len(pattern)
+    n = len(text)
+    if m == 0:
+        return n
+
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv = mask
+    mv = 0
+    score = m
+
+    for j, char in enumerate(text):
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        if max_distance is not None and score - (n - j - 1) > max_distance:
+            # Even if every remaining character lowered the score it would
+            # not get back under the cutoff
+            return max_distance + 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+def _banded_distance(first, second, max_distance):
+    """Two-row dynamic programming restricted to the diagonal band
+    |i - j| <= max_distance. first must not be longer than second.
+    """
+    first_length = len(first)
+    second_length = len(second)
+    beyond = max_distance + 1
+
+    previous = range(second_length + 1)
+    for i in xrange(1, first_length + 1):
+        low = max(1, i - max_distance)
+        high = min(second_length, i + max_distance)
+        current = [beyond] * (second_length + 1)
+        if low == 1:
+            current[0] = i
+        row_min = current[low - 1]
+        char = first[i - 1]
+        for j in xrange(low, high + 1):
+            cost = previous[j - 1]
+            if char != second[j - 1]:
+                cost += 1
+            deletion = previous[j] + 1
+            if deletion < cost:
+                cost = deletion
+            insertion = current[j - 1] + 1
+            if insertion < cost:
+                cost = insertion
+            if cost > beyond:
+                cost = beyond
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > max_distance:
+            # Every path through this row is already over the cutoff
+            return beyond
+        previous = current
+    return min(previous[second_length], beyond)
+
+def levenshtein_distance(first, second, max_distance = None):
+    """Find the Levenshtein distance between two strings.
+
+    If max_distance is given, returns max_distance + 1 as soon as it is
+    known the real distance is larger than max_distance.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    if max_distance is not None and len(second) - len(first) > max_distance:
+        return max_distance + 1
+    if len(first) <= WORD_BITS:
+        return _myers_distance(first, second, max_distance)
+    if max_distance is None:
+        max_distance = len(second)
+    return _banded_distance(first, second, max_distance)
+
+def _char_codes(name):
+    """Returns the characters of name as a NumPy array of code points,
+    one element per item of the string (the same units len() counts)
+    """
+    if isinstance(name, str):
+        return numpy.frombuffer(name, dtype = numpy.uint8)
+    if sys.maxunicode > 0xffff:
+        return numpy.frombuffer(name.encode("utf-32-le"), dtype = numpy.uint32)
+    return numpy.frombuffer(name.encode("utf-16-le"), dtype = numpy.uint16)
+
+def _numpy_scores(query, names):
+    """Runs the bit-parallel algorithm for every candidate at once, with
+    query as the pattern. query must not be longer than WORD_BITS
+    """
+    m = len(query)
+    lengths = numpy.array([len(name) for name in names], dtype = numpy.int64)
+    width = int(lengths.max())
+
+    # Candidate characters, padded with a value no query character can have
+    codes = numpy.zeros((len(names), width), dtype = numpy.int64)
+    codes.fill(-1)
+    for row, name in enumerate(names):
+        codes[row, :len(name)] = _char_codes(name)
+
+    # Pattern-match bit masks, looked up for every candidate character
+    peq = {}
+    for i, char in enumerate(query):
+        peq[ord(char)] = peq.get(ord(char), 0) | (1 << i)
+    query_chars = numpy.array(sorted(peq), dtype = numpy.int64)
+    query_masks = numpy.array([peq[c] for c in sorted(peq)], dtype = numpy.uint64)
+    index = numpy.searchsorted(query_chars, codes).clip(0, len(query_chars) - 1)
+    eq_all = numpy.where(
+        query_chars[index] == codes, query_masks[index], numpy.uint64(0)
+    )
+
+    mask = numpy.uint64((1 << m) - 1)
+    last = numpy.uint64(1 << (m - 1))
+    one = numpy.uint64(1)
+    zero = numpy.uint64(0)
+    pv = numpy.empty(len(names), dtype = numpy.uint64)
+    pv.fill(mask)
+    mv = numpy.zeros(len(names), dtype = numpy.uint64)
+    scores = numpy.empty(len(names), dtype = numpy.int64)
+    scores.fill(m)
+
+    for j in xrange(width):
+        active = lengths > j
+        eq = eq_all[:, j]
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        up = (ph & last) != zero
+        down = (mh & last) != zero
+        scores += active & up
+        scores -= active & down & ~up
+        ph = ((ph << one) | one) & mask
+        mh = (mh << one) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return [int(score) for score in scores]
+
+def score_candidates(query, names):
+    """Returns the Levenshtein distance between query and each of names, in
+    the same order as names. The results are identical to calling
+    levenshtein_distance(query, name) for each name.
+    """
+    names = list(names)
+    if (numpy is None or len(names) < NUMPY_MIN_CANDIDATES
+            or not 0 < len(query) <= WORD_BITS):
+        return [levenshtein_distance(query, name) for name in names]
+    if max(len(name) for name in names) == 0:
+        return [len(query)] * len(names)
+    return _numpy_scores(query, names)
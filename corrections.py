@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Stores for Comicvine.corrections, the volume-name to volume-id mapping.
+
+Each record holds the name searched for, the chosen volume id, the
+match_score of the chosen search result and the time it was recorded.
+
+MemoryCorrections keeps the records for the life of one Comicvine instance.
+SqliteCorrections keeps them in an SQLite database file, which any number of
+processes can share, so a name resolved once never has to be searched for
+again:
+
+>>> store = SqliteCorrections(":memory:")
+>>> store.record(u"y: the last man", 18122, score = 0)
+>>> u"y: the last man" in store
+True
+>>> store[u"y: the last man"]
+18122
+>>> store.get(u"y: the last man")['score']
+0
+
+A custom store can be used by subclassing CorrectionsStore and implementing
+get and record.
+"""
+from __future__ import with_statement
+
+__author__ = "swc/Steve"
+__version__ = "1.00"
+
+import os
+import time
+import sqlite3
+from threading import RLock
+
+class CorrectionsStore(object):
+    """Base class for corrections stores. Subclasses implement get and
+    record, the dict-style methods are built on them
+    """
+    def get(self, name):
+        """Returns the record for name, a dict with the keys "name", "id",
+        "score" and "timestamp", or None if name has not been recorded
+        """
+        raise NotImplementedError()
+
+    def record(self, name, sid, score = None):
+        """Records that name resolves to the volume id sid
+        """
+        raise NotImplementedError()
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        found = self.get(name)
+        if found is None:
+            raise KeyError(name)
+        return found['id']
+
+    def __setitem__(self, name, sid):
+        self.record(name, sid)
+
+
+class MemoryCorrections(CorrectionsStore):
+    """Keeps corrections in memory, for the life of the instance
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.records = {}
+
+    def get(self, name):
+        with self.lock:
+            return self.records.get(name)
+
+    def record(self, name, sid, score = None):
+        with self.lock:
+            self.records[name] = {
+                'name': name,
+                'id': sid,
+                'score': score,
+                'timestamp': time.time(),
+            }
+
+    def __repr__(self):
+        return repr(dict((name, r['id']) for name, r in self.records.items()))
+
+
+class SqliteCorrections(CorrectionsStore):
+    """Keeps corrections in an SQLite database file, which can be shared by
+    concurrent threads and processes
+    """
+    def __init__(self, path, timeout = 30):
+        """path is the database file, created if it does not exist.
+        timeout is how long (in seconds) to wait for another process
+        holding a write lock on the file
+        """
+        self.path = path
+        self.timeout = timeout
+        self.lock = RLock()
+        self.connection = None
+        self.pid = None
+        with self.lock:
+            self._connect().execute(
+                "CREATE TABLE IF NOT EXISTS corrections ("
+                " name TEXT PRIMARY KEY,"
+                " volume_id INTEGER NOT NULL,"
+                " score INTEGER,"
+                " timestamp REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        """Returns the connection for this process, (re)connecting after a
+        fork, since SQLite connections must not be shared between processes
+        """
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(
+                self.path,
+                timeout = self.timeout,
+                isolation_level = None, # autocommit, each write is atomic
+                check_same_thread = False
+            )
+            try:
+                # Readers do not block the writer (and vice versa)
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.DatabaseError:
+                pass
+            self.pid = os.getpid()
+        return self.connection
+
+    def get(self, name):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT name, volume_id, score, timestamp FROM corrections"
+                " WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'name': row[0], 'id': row[1], 'score': row[2], 'timestamp': row[3]}
+
+    def record(self, name, sid, score = None):
+        with self.lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO corrections (name, volume_id, score, timestamp)"
+                " VALUES (?, ?, ?, ?)", (name, sid, score, time.time())
+            )
+
+    def __repr__(self):
+        return "<SqliteCorrections %s>" % (self.path)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Client-side rate limiting for requests to Comic Vine.
+
+TokenBucket paces requests to rate per second (if rate is not None),
+allowing bursts of up to burst requests. After a failed request it holds back every request for an
+exponentially growing, randomly jittered delay, and after a throttling
+response (429 or 503) for as long as the server's Retry-After header asks.
+
+get_limiter returns one TokenBucket per API key, shared by every Comicvine
+instance (and thread) using that key. The strictest rate and burst asked
+for apply:
+
+>>> bucket = get_limiter("an api key", rate = 5, burst = 2)
+>>> bucket is get_limiter("an api key", rate = 10, burst = 3)
+True
+>>> bucket.rate, bucket.burst
+(5.0, 2)
+>>> bucket.reserve()
+0
+>>> bucket.reserve()
+0
+>>> 0 < bucket.reserve() <= 0.2
+True
+"""
+from __future__ import with_statement
+
+__author__ = "swc/Steve"
+__version__ = "1.00"
+
+import time
+import random
+import urllib2
+from threading import RLock
+
+class TokenBucket(object):
+    """Token bucket with exponential backoff, safe to share between threads
+    """
+    def __init__(self, rate, burst = 1, backoff = 1.0, max_backoff = 60.0):
+        """rate is the number of requests allowed per second on average
+        (None for no limit), burst how many may be made back to back.
+        backoff is the delay
+        (in seconds) after the first failure, doubling with each further
+        failure up to max_backoff
+        """
+        self.rate = None if rate is None else float(rate)
+        self.burst = burst
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = RLock()
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.blocked_until = 0
+        self.failures = 0
+
+    def tighten(self, rate, burst):
+        """Lowers the rate and burst of the bucket to rate and burst, where
+        they are stricter
+        """
+        if rate is None:
+            return
+        with self.lock:
+            if self.rate is None:
+                self.rate = float(rate)
+                self.burst = burst
+                self.tokens = float(burst)
+                self.updated = time.time()
+            else:
+                self.rate = min(self.rate, float(rate))
+                self.burst = min(self.burst, burst)
+                self.tokens = min(self.tokens, float(self.burst))
+
+    def reserve(self):
+        """Takes a token and returns 0 if a request may be made now,
+        otherwise returns how many seconds to wait before trying again
+        """
+        with self.lock:
+            now = time.time()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.rate is None:
+                return 0
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Blocks until a request may be made
+        """
+        wait = self.reserve()
+        while wait:
+            time.sleep(wait)
+            wait = self.reserve()
+
+    def success(self):
+        """Records a successful request, ending any backoff
+        """
+        with self.lock:
+            self.failures = 0
+
+    def failure(self):
+        """Records a failed request, holding back further requests for a
+        jittered, exponentially growing delay
+        """
+        with self.lock:
+            self.failures += 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+            self._block(random.uniform(delay / 2, delay))
+
+    def throttled(self, retry_after = None):
+        """Records a throttling response. Requests are held back for
+        retry_after seconds if given, otherwise as for a failure
+        """
+        if retry_after is None:
+            self.failure()
+        else:
+            with self.lock:
+                self._block(min(self.max_backoff, retry_after))
+
+    def _block(self, delay):
+        self.blocked_until = max(self.blocked_until, time.time() + delay)
+
+
+_limiters = {}
+_limiters_lock = RLock()
+
+def get_limiter(key, rate, burst = 1):
+    """Returns the TokenBucket for key (an API key), creating it with rate
+    and burst the first time, and tightening it to them afterwards (see
+    TokenBucket.tighten)
+    """
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = TokenBucket(rate, burst)
+        else:
+            _limiters[key].tighten(rate, burst)
+        return _limiters[key]
+
+
+def retry_after(response):
+    """Returns the Retry-After header of response in seconds, or None
+    """
+    try:
+        return max(0, int(response.info().get("Retry-After", "")))
+    except ValueError:
+        return None
+
+
+class ThrottleHandler(urllib2.HTTPHandler):
+    """Wraps a transport (see transport.py), pacing its requests through a
+    TokenBucket and retrying failed or throttled requests (which the bucket
+    backs off from, whether or not it has a rate)
+    """
+    # Server responses which ask the client to slow down
+    throttle_codes = (429, 503)
+
+    def __init__(self, transport, limiter, retries = 3):
+        urllib2.HTTPHandler.__init__(self)
+        self.transport = transport
+        self.limiter = limiter
+        self.retries = retries
+
+    def http_open(self, req):
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire()
+            try:
+                resp = self.transport.http_open(req)
+            except urllib2.URLError:
+                self.limiter.failure()
+                if attempt > self.retries:
+                    raise
+                continue
+
+            if resp.code in self.throttle_codes:
+                self.limiter.throttled(retry_after(resp))
+                if attempt <= self.retries:
+                    resp.close()
+                    continue
+            elif resp.code >= 500:
+                self.limiter.failure()
+            else:
+                self.limiter.success()
+            return resp
@@ -24,7 +24,7 @@ Basic usage is:
 u'Unmanned'
 """,
 
-py_modules = ['comicvine_api', 'comicvine_ui', 'comicvine_exceptions', 'cache'],
+py_modules = ['comicvine_api', 'comicvine_async', 'comicvine_ui', 'comicvine_exceptions', 'comicvine_match', 'breaker', 'cache', 'corrections', 'ratelimit', 'transport'],
 
 classifiers=[
     "Intended Audience :: Developers",
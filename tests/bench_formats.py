@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Parse throughput of XML and JSON volume documents and search pages.
+
+Both formats are recorded once from a local stand-in server (see
+transport.RecordHandler), then the recorded bodies are replayed and parsed
+repeatedly, the way Comicvine parses them for each format.
+"""
+
+import sys
+import time
+import shutil
+import StringIO
+import tempfile
+
+sys.path.append("..")
+
+import comicvine_api
+from comicvine_api import Comicvine
+from transport import KeepAliveHandler, RecordHandler, ReplayHandler
+from standin import ComicvineStandIn
+
+LIBRARY = dict(
+    (sid, (u"Detective Comics %d" % sid, [u"Issue %d" % n for n in range(1, 1001)]))
+    for sid in range(1, 101)
+)
+
+def make_comicvine(server, transport, format):
+    return server.point_at(Comicvine(cache = False,
+        circuit_breaker = False, transport = transport, format = format, page_size = 100))
+
+def parsers(c, sid):
+    """Returns (volume document parser, search page parser) for the format
+    c was made with, each taking the body as a string
+    """
+    if c.config['format'] == 'json':
+        volume = lambda src: c._parseVolumeJson(sid, comicvine_api.json.loads(src))
+    else:
+        volume = lambda src: c._parseVolumeDocument(sid, StringIO.StringIO(src))
+    return volume, c._parseSearchPage
+
+def main(sid = 42, count = 50):
+    server = ComicvineStandIn(LIBRARY)
+    server.start()
+    fixtures = tempfile.mkdtemp()
+    try:
+        transport = KeepAliveHandler()
+        for format in ('xml', 'json'):
+            c = make_comicvine(server, RecordHandler(transport, fixtures), format)
+            c._loadUrl(c._searchUrl(u"detective comics", 0))
+            c._loadUrl(c.config['url_volumeInfo'] % (sid))
+        transport.pool.close()
+        server.stop()
+
+        print "%d parses of a volume document with %d issues, and of a search page" % (
+            count, len(LIBRARY[sid][1]))
+        print "JSON decoder: %s" % comicvine_api.json.__name__
+        print "%-8s %-8s %10s %12s %10s" % ("format", "document", "bytes", "parses/s", "MB/s")
+        for format in ('xml', 'json'):
+            c = make_comicvine(server, ReplayHandler(fixtures), format)
+            volume, search = parsers(c, sid)
+            for label, url, parse in (
+                    ("volume", c.config['url_volumeInfo'] % (sid), volume),
+                    ("search", c._searchUrl(u"detective comics", 0), search)):
+                src = c._loadUrl(url)
+                start = time.time()
+                for i in range(count):
+                    parse(src)
+                elapsed = time.time() - start
+                print "%-8s %-8s %10d %12.0f %10.1f" % (
+                    format, label, len(src), count / elapsed, len(src) * count / elapsed / 1e6)
+    finally:
+        shutil.rmtree(fixtures)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Benchmark of downloading a large site detail page uncompressed, gzipped
+and decompressed after reading the whole body (the old _loadUrl), and
+gzipped and decompressed as it is read (Comicvine._iterBody).
+
+Each way runs in its own process, so the peak memory (maximum resident set
+size) it reports is its own.
+"""
+
+import sys
+import gzip
+import time
+import urllib2
+import resource
+import StringIO
+import subprocess
+
+sys.path.append("..")
+
+from comicvine_api import Comicvine
+from standin import ComicvineStandIn
+
+def identity(url):
+    return urllib2.build_opener().open(url).read()
+
+def buffered(url):
+    opener = urllib2.build_opener()
+    opener.addheaders.append(('Accept-Encoding', 'gzip'))
+    resp = opener.open(url)
+    stream = StringIO.StringIO(resp.read())
+    return gzip.GzipFile(fileobj = stream).read()
+
+def streamed(url):
+    c = Comicvine(cache = False, circuit_breaker = False)
+    return c._fetchUrl(url)[0]
+
+modes = (
+    ("identity", identity),
+    ("gzip, buffered", buffered),
+    ("gzip, streamed", streamed),
+)
+
+def child(mode, url, count):
+    func = dict(modes)[mode]
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for i in range(count):
+        body = func(url)
+        del body
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print elapsed, peak
+
+def main(issues = 40000, count = 5):
+    server = ComicvineStandIn({1: (u"Detective Comics", [u"Issue"] * issues)},
+        issues_per_page = issues, gzip = True)
+    server.start()
+    url = server.site_detail_url(1) + "?page=1"
+    try:
+        print "site detail page of %d issues, %d downloads" % (issues, count)
+        print "%-16s %10s %14s %16s" % ("mode", "seconds", "bytes on wire", "peak memory KB")
+        for mode, func in modes:
+            sent = server.bytes_sent
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--child", mode, url, str(count)]
+            )
+            elapsed, peak = output.split()
+            print "%-16s %10.3f %14d %16s" % (
+                mode, float(elapsed), (server.bytes_sent - sent) // count, peak
+            )
+    finally:
+        server.stop()
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Micro-benchmark of comicvine_match.levenshtein_distance against the
+original full-matrix implementation, using real volume-name pairs
+"""
+
+import sys
+import timeit
+
+sys.path.append("..")
+
+from comicvine_match import levenshtein_distance
+
+# (query, candidate volume name) pairs, as scored by Comicvine._getvolume
+VOLUME_PAIRS = [
+    (u"y: the last man", u"Y: The Last Man"),
+    (u"y: the last man", u"The Last Man Standing"),
+    (u"batman", u"Batman"),
+    (u"batman", u"Batman and the Outsiders"),
+    (u"batman", u"Batman: Legends of the Dark Knight"),
+    (u"batman", u"Superman/Batman"),
+    (u"the walking dead", u"The Walking Dead"),
+    (u"the walking dead", u"The Walking Dead: The Governor"),
+    (u"fables", u"Fables"),
+    (u"fables", u"Jack of Fables"),
+    (u"detective comics", u"Detective Comics"),
+    (u"detective comics", u"Detective Comics Annual"),
+    (u"sandman", u"The Sandman Presents: The Furies"),
+    (u"v for vendetta", u"V for Vendetta"),
+    (u"blankets", u"Blankets"),
+    (u"the amazing spider-man", u"The Amazing Spider-Man"),
+    (u"the amazing spider-man", u"Marvel Adventures Spider-Man"),
+    (u"league of extraordinary gentlemen",
+        u"The League of Extraordinary Gentlemen: Century"),
+    (u"the league of extraordinary gentlemen volume iii century 1910 and 1969",
+        u"The League of Extraordinary Gentlemen Volume III: Century"),
+    (u"transmetropolitan",
+        u"Transmetropolitan: Tales of Human Waste and Other Stories of the City"),
+]
+
+def reference_distance(first, second):
+    """The original list-of-lists implementation from comicvine_api"""
+    if len(first) > len(second):
+        first, second = second, first
+    if len(second) == 0:
+        return len(first)
+    first_length = len(first) + 1
+    second_length = len(second) + 1
+    distance_matrix = [[0] * second_length for x in range(first_length)]
+    for i in range(first_length):
+        distance_matrix[i][0] = i
+    for j in range(second_length):
+        distance_matrix[0][j] = j
+    for i in xrange(1, first_length):
+        for j in range(1, second_length):
+            deletion = distance_matrix[i-1][j] + 1
+            insertion = distance_matrix[i][j-1] + 1
+            substitution = distance_matrix[i-1][j-1]
+            if first[i-1] != second[j-1]:
+                substitution += 1
+            distance_matrix[i][j] = min(insertion, deletion, substitution)
+    return distance_matrix[first_length-1][second_length-1]
+
+def check_ranking():
+    """Both implementations must agree on every pair"""
+    for query, name in VOLUME_PAIRS:
+        expected = reference_distance(query, name)
+        got = levenshtein_distance(query, name)
+        assert expected == got, "%r / %r: %s != %s" % (query, name, expected, got)
+
+def bench(label, func, number):
+    timer = timeit.Timer(lambda: [func(q, n) for q, n in VOLUME_PAIRS])
+    best = min(timer.repeat(repeat = 5, number = number))
+    per_pair = best / (number * len(VOLUME_PAIRS)) * 1e6
+    print "%-28s %8.2f us/pair" % (label, per_pair)
+    return per_pair
+
+def main():
+    check_ranking()
+    number = 50
+    print "%d volume-name pairs, best of 5 x %d runs" % (len(VOLUME_PAIRS), number)
+    old = bench("full matrix (original)", reference_distance, number)
+    new = bench("bit-parallel/banded", levenshtein_distance, number)
+    cut = bench("bit-parallel/banded, k=5",
+        lambda q, n: levenshtein_distance(q, n, max_distance = 5), number)
+    print "speedup: %.1fx (no cutoff), %.1fx (k=5)" % (old / new, old / cut)
+
+if __name__ == '__main__':
+    main()
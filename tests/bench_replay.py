@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Offline benchmark of the search, volume document and site detail
+scraping paths, replaying recorded responses (see transport.ReplayHandler)
+under a few simulated network conditions.
+
+The responses are recorded once from a local stand-in server into a
+temporary fixture directory, so every run replays exactly the same bytes.
+"""
+
+import sys
+import time
+import shutil
+import StringIO
+import tempfile
+
+sys.path.append("..")
+
+import comicvine_api
+from comicvine_api import Comicvine
+from transport import KeepAliveHandler, RecordHandler, ReplayHandler
+from standin import ComicvineStandIn
+
+LIBRARY = dict(
+    (sid, (u"Detective Comics %d" % sid, [u"Issue %d" % n for n in range(1, 300)]))
+    for sid in range(1, 41)
+)
+
+# (label, latency in seconds, bandwidth in bytes per second)
+LINKS = (
+    ("local", 0, None),
+    ("broadband", 0.02, 2000000),
+    ("slow", 0.1, 200000),
+)
+
+def lookup(c, name):
+    """Times each path of a lookup of name, returning (search, volume,
+    scraping) seconds
+    """
+    start = time.time()
+    sid = c._getvolume(name)['id']
+    searched = time.time()
+    siteDetailUrl, issueNames = c._parseVolumeDocument(
+        sid, StringIO.StringIO(c._loadUrl(c.config['url_volumeInfo'] % (sid)))
+    )
+    loaded = time.time()
+    scan = lambda url: c._parseUrl(url, c._scanSiteDetail)
+    last, issues = scan(c.config['url_siteDetail'] % (siteDetailUrl, 1))
+    pages = comicvine_api._parallel_map(scan, [
+        c.config['url_siteDetail'] % (siteDetailUrl, page)
+        for page in range(2, last + 1)
+    ], c.config['workers'])
+    c._setSiteDetailIssues(sid, issues)
+    for pagelast, pageissues in pages:
+        c._setSiteDetailIssues(sid, pageissues)
+    c._parseIssueNames(sid, issueNames)
+    return searched - start, loaded - searched, time.time() - loaded
+
+def make_comicvine(server, transport):
+    return server.point_at(Comicvine(cache = False,
+        circuit_breaker = False, transport = transport))
+
+def main(name = "detective comics 17"):
+    server = ComicvineStandIn(LIBRARY, issues_per_page = 50, gzip = True)
+    server.start()
+    fixtures = tempfile.mkdtemp()
+    try:
+        transport = KeepAliveHandler()
+        lookup(make_comicvine(server, RecordHandler(transport, fixtures)), name)
+        transport.pool.close()
+        server.stop()
+
+        print "lookup of %r, %d recorded responses" % (name, server.requests)
+        print "%-10s %10s %10s %10s %10s" % ("link", "search", "volume", "scraping", "total")
+        for label, latency, bandwidth in LINKS:
+            times = lookup(make_comicvine(server, ReplayHandler(fixtures, latency, bandwidth)), name)
+            print "%-10s %10.3f %10.3f %10.3f %10.3f" % ((label, ) + times + (sum(times), ))
+    finally:
+        shutil.rmtree(fixtures)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Benchmark of comicvine_match.score_candidates against scoring each
+search result separately, at 20, 200 and 2000 candidates
+"""
+
+import sys
+import random
+import timeit
+from operator import itemgetter
+
+sys.path.append("..")
+
+import comicvine_match
+from comicvine_match import levenshtein_distance, score_candidates
+from bench_levenshtein import VOLUME_PAIRS
+
+def make_candidates(count, seed = 0):
+    """Builds count search-result dicts from real volume names, with some
+    words appended so the names resemble a broad search
+    """
+    rng = random.Random(seed)
+    names = [name for query, name in VOLUME_PAIRS]
+    suffixes = [u"", u" Annual", u" Special", u" (2011)", u": Year One",
+        u" and Robin", u" Presents", u" Secret Files and Origins"]
+    candidates = []
+    for i in xrange(count):
+        name = rng.choice(names) + rng.choice(suffixes)
+        candidates.append({'id': i, 'volumename': name})
+    return candidates
+
+def score_each(query, candidates):
+    for result in candidates:
+        result['match_score'] = levenshtein_distance(query, result['volumename'])
+    return sorted(candidates, key=itemgetter('match_score'))
+
+def score_batch(query, candidates):
+    scores = score_candidates(query, [r['volumename'] for r in candidates])
+    for result, score in zip(candidates, scores):
+        result['match_score'] = score
+    return sorted(candidates, key=itemgetter('match_score'))
+
+def score_batch_numpy(query, candidates):
+    scores = comicvine_match._numpy_scores(query, [r['volumename'] for r in candidates])
+    for result, score in zip(candidates, scores):
+        result['match_score'] = score
+    return sorted(candidates, key=itemgetter('match_score'))
+
+def bench(func, query, candidates, number):
+    timer = timeit.Timer(lambda: func(query, candidates))
+    return min(timer.repeat(repeat = 3, number = number)) / number * 1000
+
+def main():
+    query = u"batman"
+    print "NumPy available: %s" % (comicvine_match.numpy is not None)
+    print "%6s %14s %14s %14s" % ("count", "per-result ms", "batch ms", "numpy pass ms")
+    for count in (20, 200, 2000):
+        candidates = make_candidates(count)
+        expected = [r['id'] for r in score_each(query, [dict(r) for r in candidates])]
+        got = [r['id'] for r in score_batch(query, [dict(r) for r in candidates])]
+        assert expected == got, "batch ordering differs at %d candidates" % count
+        if comicvine_match.numpy is not None:
+            got = [r['id'] for r in score_batch_numpy(query, [dict(r) for r in candidates])]
+            assert expected == got, "NumPy ordering differs at %d candidates" % count
+        number = max(1, 2000 // count)
+        print "%6d %14.2f %14.2f %14.2f" % (
+            count,
+            bench(score_each, query, candidates, number),
+            bench(score_batch, query, candidates, number),
+            comicvine_match.numpy is not None
+                and bench(score_batch_numpy, query, candidates, number)
+                or float('nan'),
+        )
+
+if __name__ == '__main__':
+    main()
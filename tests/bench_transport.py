@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Benchmark of transport.KeepAliveHandler against urllib2's default
+handler (a new connection per request), using a local stand-in server.
+
+The stand-in server waits connect_delay seconds before handling each new
+connection, standing in for the TCP/TLS handshake round trips to the real
+server.
+"""
+
+import sys
+import time
+import urllib2
+
+sys.path.append("..")
+
+from transport import KeepAliveHandler
+from standin import StandInServer
+
+def run(opener, server, count):
+    start = time.time()
+    for i in xrange(count):
+        opener.open(server.url + "/volume/%d/" % (i % 10)).read()
+    return time.time() - start
+
+def main(count = 200, connect_delay = 0.005):
+    body = "<response><results>%s</results></response>" % ("x" * 4000)
+    routes = dict(("/volume/%d/" % i, (200, {}, body)) for i in range(10))
+
+    print "%d requests, %.1f ms simulated connection setup" % (count, connect_delay * 1000)
+    print "%-22s %10s %12s %10s" % ("transport", "seconds", "connections", "req/s")
+    keepalive = KeepAliveHandler()
+    for label, opener in (
+            ("urllib2 default", urllib2.build_opener()),
+            ("KeepAliveHandler", urllib2.build_opener(keepalive))):
+        server = StandInServer(routes, connect_delay = connect_delay)
+        server.start()
+        try:
+            elapsed = run(opener, server, count)
+        finally:
+            keepalive.pool.close()
+            server.stop()
+        print "%-22s %10.3f %12d %10.0f" % (label, elapsed, server.connections, count / elapsed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""Local stand-in HTTP server for offline tests and benchmarks.
+
+Serves canned responses from a dict of path (including the query string)
+to (status, headers, body), speaking HTTP/1.1 with keep-alive, and counts
+the connections and requests it receives:
+
+>>> server = StandInServer({'/hello': (200, {}, 'world')})
+>>> server.start()
+>>> import urllib2
+>>> urllib2.urlopen(server.url + '/hello').read()
+'world'
+>>> server.requests
+1
+>>> server.stop()
+"""
+
+import sys
+import json
+import time
+import zlib
+import socket
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+from xml.sax.saxutils import escape
+
+sys.path.append("..")
+
+from comicvine_match import normalize_name
+
+def gzip_body(body):
+    """Returns body gzipped, as a server sends it with Content-Encoding: gzip
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send each response in one write, without Nagle's algorithm holding
+    # back the tail of it (keep-alive clients would wait on delayed ACKs)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server.standin
+        server.count('requests')
+        server.paths.append(self.path)
+        if server.latency:
+            time.sleep(server.latency)
+        status, headers, body = server.respond(self.path, self.headers)
+        if server.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip_body(body)
+            headers = dict(headers, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        server.count('bytes_sent', len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def process_request(self, request, client_address):
+        self.standin.count('connections')
+        self.standin.sockets.append(request)
+        if self.standin.connect_delay:
+            # Stands in for the round trips of a real TCP (and TLS) setup
+            time.sleep(self.standin.connect_delay)
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are not errors here
+        pass
+
+
+class StandInServer(object):
+    """Serves routes on a random localhost port from a background thread.
+
+    routes maps paths to (status, headers, body). Paths not in routes get a
+    404, unless respond is overridden. latency is added before every
+    response, connect_delay before handling every new connection. If gzip is
+    True, responses are gzipped for clients which accept it. bytes_sent
+    counts the response body bytes sent.
+    """
+    def __init__(self, routes = None, latency = 0, connect_delay = 0, gzip = False):
+        self.routes = routes or {}
+        self.latency = latency
+        self.connect_delay = connect_delay
+        self.gzip = gzip
+        self.connections = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.paths = []
+        self.sockets = []
+        self.lock = threading.Lock()
+        self.httpd = _ThreadingServer(("127.0.0.1", 0), StandInHandler)
+        self.httpd.standin = self
+        self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+
+    def count(self, name, amount = 1):
+        self.lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + amount)
+        finally:
+            self.lock.release()
+
+    def respond(self, path, headers):
+        """Returns (status, headers, body) for a GET of path
+        """
+        if path in self.routes:
+            return self.routes[path]
+        return 404, {}, "Not found"
+
+    def start(self):
+        thread = threading.Thread(target = self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        # Drop keep-alive connections clients left open
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class ComicvineStandIn(StandInServer):
+    """Stand-in for the Comic Vine API and site, serving a small library of
+    volumes: the search and volume documents (as XML, or JSON if asked for),
+    and the paginated site detail pages listing each volume's issues.
+
+    library maps volume ids to (name, [issue names]). Issue n of volume sid
+    has the id sid * 1000 + n.
+    """
+    def __init__(self, library, issues_per_page = 50, **kwargs):
+        StandInServer.__init__(self, **kwargs)
+        self.library = library
+        self.issues_per_page = issues_per_page
+
+    def point_at(self, c):
+        """Points a Comicvine instance's API URLs at this server
+        """
+        for key in ('url_getvolume', 'url_volumeInfo', 'url_issInfo'):
+            c.config[key] = c.config[key].replace(c.config['base_url'], self.url)
+        return c
+
+    def respond(self, path, headers):
+        parts = urlparse.urlparse(path)
+        query = dict(urlparse.parse_qsl(parts.query))
+        segments = [p for p in parts.path.split("/") if p]
+        if segments == ['search'] and query.get('format') == 'json':
+            return 200, {}, self.search_json(query)
+        if segments == ['search']:
+            return 200, {}, self.search_xml(query)
+        if len(segments) == 2 and segments[0] == 'volume' and query.get('format') == 'json':
+            return 200, {}, self.volume_json(int(segments[1]), query)
+        if len(segments) == 2 and segments[0] == 'volume':
+            return 200, {}, self.volume_xml(int(segments[1]), query)
+        if len(segments) == 2 and segments[1].startswith('49-'):
+            return 200, {}, self.site_detail_html(
+                int(segments[1][3:]), int(query.get('page', 1))
+            )
+        return 404, {}, "Not found"
+
+    def search(self, query):
+        """Returns (total results, [(id, name)] on the requested page)
+        """
+        wanted = normalize_name(query['query'].decode("utf-8"))
+        found = [(sid, name) for sid, (name, issues) in sorted(self.library.items())
+            if wanted in normalize_name(name)]
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 20))
+        return len(found), found[offset:offset + limit]
+
+    def search_xml(self, query):
+        total, found = self.search(query)
+        volumes = "".join(
+            "<volume><id>%d</id><name>%s</name></volume>" % (sid, escape(name))
+            for sid, name in found
+        )
+        return (
+            "<response><number_of_total_results>%d</number_of_total_results>"
+            "<results>%s</results></response>" % (total, volumes)
+        )
+
+    def search_json(self, query):
+        total, found = self.search(query)
+        return json.dumps({
+            'number_of_total_results': total,
+            'results': [{'id': sid, 'name': name} for sid, name in found],
+        })
+
+    def site_detail_url(self, sid):
+        return "%s/volume-%d/49-%d/" % (self.url, sid, sid)
+
+    def volume_fields(self, sid, query):
+        """Returns the fields of volume sid as (name, value) pairs, only
+        those in the field_list parameter if there is one. The value of
+        issues is a list of (id, name)
+        """
+        name, issues = self.library[sid]
+        fields = [
+            ('id', sid),
+            ('name', name),
+            ('site_detail_url', self.site_detail_url(sid)),
+            ('publisher', u"Stand-in Comics"),
+            ('description', u"<p>%s</p>" % name),
+            ('issues', [(sid * 1000 + n, issue) for n, issue in enumerate(issues, 1)]),
+        ]
+        if 'field_list' in query:
+            wanted = query['field_list'].split(",")
+            fields = [(field, value) for field, value in fields if field in wanted]
+        return fields
+
+    def volume_xml(self, sid, query = {}):
+        results = []
+        for field, value in self.volume_fields(sid, query):
+            if field == 'issues':
+                value = "".join("<issue><id>%d</id><name>%s</name></issue>" % (
+                    iid, escape(issue)) for iid, issue in value)
+            else:
+                value = escape(unicode(value))
+            results.append(u"<%s>%s</%s>" % (field, value, field))
+        return (u"<response><results>%s</results></response>" % "".join(results)).encode("utf-8")
+
+    def volume_json(self, sid, query = {}):
+        results = dict(self.volume_fields(sid, query))
+        if 'issues' in results:
+            results['issues'] = [{'id': iid, 'name': issue} for iid, issue in results['issues']]
+        return json.dumps({'results': results})
+
+    def site_detail_html(self, sid, page):
+        name, issues = self.library[sid]
+        pages = max(1, (len(issues) + self.issues_per_page - 1) // self.issues_per_page)
+        start = (page - 1) * self.issues_per_page + 1
+        listed = range(start, min(len(issues), start + self.issues_per_page - 1) + 1)
+        html = ["<html><body><h1>%s</h1>" % escape(name)]
+        for n in listed:
+            html.append(
+                '<div class="comic-container"><a href="/issue-%d/37-%d/">'
+                '<img src="cover.jpg"></a><span class="issue">Issue #%d</span></div>'
+                % (n, sid * 1000 + n, n)
+            )
+        if pages > 1:
+            html.append('<a href="?page=%d&amp;sort=issue_number">Last</a>' % pages)
+        html.append("</body></html>")
+        return "\n".join(html)
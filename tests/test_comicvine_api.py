@@ -10,16 +10,33 @@
 Modified from http://github.com/dbr/tvdb_api
 """
 
+import os
 import sys
+import time
+import shutil
+import httplib
+import urllib2
 import datetime
+import tempfile
 import unittest
+import StringIO
+import threading
 
 sys.path.append("..")
 
 import comicvine_api
 import comicvine_ui
-from comicvine_exceptions import (comicvine_error, comicvine_userabort, comicvine_seriesnotfound,
-    comicvine_issuenotfound, comicvine_attributenotfound)
+import comicvine_match
+import comicvine_async
+from cache import CacheHandler, calculate_cache_path, exists_in_cache, store_in_cache
+from breaker import CircuitBreaker
+from ratelimit import TokenBucket, ThrottleHandler
+from transport import KeepAliveHandler, RecordHandler, ReplayHandler
+from standin import StandInServer, ComicvineStandIn, gzip_body
+from bench_levenshtein import VOLUME_PAIRS, reference_distance
+from bench_scoring import make_candidates
+from comicvine_exceptions import (comicvine_error, comicvine_userabort,
+    comicvine_volumenotfound, comicvine_unavailable, comicvine_issuenotfound, comicvine_attributenotfound)
 
 class test_comicvine_basic(unittest.TestCase):
     # Used to store the cached instance of Comicvine()
@@ -80,7 +97,7 @@ class test_comicvine_errors(unittest.TestCase):
     def test_seriesnotfound(self):
         """Checks exception is thrown when issue doesn't exist.
         """
-        self.assertRaises(comicvine_seriesnotfound, lambda:self.c['the fake series thingy'])
+        self.assertRaises(comicvine_volumenotfound, lambda:self.c['the fake series thingy'])
     
     def test_issuenotfound(self):
         """Checks exception is raised for non-existent issue
@@ -210,6 +227,836 @@ class test_comicvine_credits(unittest.TestCase):
             "Robert Kirkman"
         )
 
+class test_comicvine_match(unittest.TestCase):
+    def test_distance_matches_reference(self):
+        """Bit-parallel and banded distances agree with the full matrix
+        """
+        for query, name in VOLUME_PAIRS:
+            self.assertEquals(
+                comicvine_match.levenshtein_distance(query, name),
+                reference_distance(query, name)
+            )
+
+    def test_distance_cutoff(self):
+        """Distances over max_distance are reported as max_distance + 1
+        """
+        long_name = u"The League of Extraordinary Gentlemen " * 3
+        self.assertEquals(
+            comicvine_match.levenshtein_distance(u"batman", u"superman", max_distance = 2),
+            3
+        )
+        self.assertEquals(
+            comicvine_match.levenshtein_distance(long_name, long_name[:-1], max_distance = 2),
+            1
+        )
+        self.assertEquals(
+            comicvine_match.levenshtein_distance(long_name, u"Batman", max_distance = 10),
+            11
+        )
+
+    def test_score_candidates(self):
+        """Batch scoring gives the same scores as scoring each name
+        """
+        names = [r['volumename'] for r in make_candidates(500)]
+        expected = [comicvine_match.levenshtein_distance(u"batman", n) for n in names]
+        self.assertEquals(comicvine_match.score_candidates(u"batman", names), expected)
+        if comicvine_match.numpy is not None:
+            self.assertEquals(comicvine_match._numpy_scores(u"batman", names), expected)
+
+class OfflineComicvine(comicvine_api.Comicvine):
+    """Comicvine instance that answers volume searches from canned results
+    instead of the network, and records every URL it was asked for
+    """
+    def __init__(self, volumenames, **kwargs):
+        comicvine_api.Comicvine.__init__(self, cache = False, **kwargs)
+        self.volumenames = volumenames
+        self.requested = []
+        self.loaded = []
+
+    def _getvolumeData(self, sid, fields = None):
+        self.loaded.append(sid)
+        self._setvolumeData(sid, 'volumename', self.volumenames[sid])
+
+    def _loadBody(self, url, recache = False):
+        self.requested.append(url)
+        params = dict(p.split("=", 1) for p in url.split("?", 1)[1].split("&"))
+        limit, offset = int(params['limit']), int(params['offset'])
+        volumes = [
+            "<volume><id>%d</id><name>%s</name></volume>" % (sid, name)
+            for sid, name in enumerate(self.volumenames)
+        ]
+        results = "".join(volumes[offset:offset + limit])
+        return (
+            "<response><number_of_total_results>%d</number_of_total_results>"
+            "<results>%s</results></response>" % (len(self.volumenames), results)
+        ), None
+
+class test_comicvine_paging(unittest.TestCase):
+    def test_all_pages_fetched_once(self):
+        """Every page of search results is requested exactly once
+        """
+        names = ["Batman %d" % i for i in range(95)] + ["Batman"]
+        c = OfflineComicvine(names, page_size = 20, workers = 4)
+        self.assertEquals(c._getvolume("Batman")['volumename'], "Batman")
+        self.assertEquals(len(c.requested), 5)
+        self.assertEquals(len(set(c.requested)), 5)
+
+    def test_early_exit(self):
+        """Paging stops once a close enough match is found
+        """
+        names = ["Batman %d" % i for i in range(15)] + ["batman"]
+        names += ["Batman %d" % i for i in range(15, 100)]
+        c = OfflineComicvine(names, page_size = 10, workers = 1, early_exit = True)
+        self.assertEquals(c._getvolume("batman")['volumename'], "batman")
+        self.assertEquals(len(c.requested), 2)
+
+    def test_max_results(self):
+        """Paging stops once max_results have been retrieved
+        """
+        names = ["Batman %d" % i for i in range(100)]
+        c = OfflineComicvine(names, page_size = 10, workers = 2, max_results = 25)
+        c._getvolume("batman")
+        self.assertEquals(len(c.requested), 3)
+
+    def test_single_page(self):
+        """A search whose results fit on one page makes one request
+        """
+        c = OfflineComicvine(["Batman", "Batman Beyond"])
+        self.assertEquals(c._getvolume("batman")['volumename'], "Batman")
+        self.assertEquals(len(c.requested), 1)
+
+    def test_iter_search(self):
+        """iter_search yields scored results, fetching pages as it goes
+        """
+        names = ["Batman %d" % i for i in range(100)]
+        c = OfflineComicvine(names, page_size = 10, workers = 1)
+        results = c.iter_search("batman")
+        first = results.next()
+        self.assertEquals(first['volumename'], "Batman 0")
+        self.assertEquals(first['match_score'], 2)
+        self.assertEquals(len(c.requested), 1)
+        self.assertEquals(len(list(results)), 99)
+        self.assertEquals(len(c.requested), 10)
+
+    def test_parallel_map_order(self):
+        """Results come back in the order of the inputs
+        """
+        self.assertEquals(
+            comicvine_api._parallel_map(lambda x: x * 2, range(50), 8),
+            [x * 2 for x in range(50)]
+        )
+
+class test_comicvine_corrections(unittest.TestCase):
+    def test_persistent_corrections(self):
+        """A name resolved by one instance is not searched for by the next
+        one sharing the corrections database
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "corrections.db")
+            names = ["Fables", "Jack of Fables"]
+            c = OfflineComicvine(names, corrections = path)
+            self.assertEquals(c['jack of fables']['volumename'], "Jack of Fables")
+            self.assertEquals(len(c.requested), 1)
+
+            c = OfflineComicvine(names, corrections = path)
+            self.assertEquals(c['jack of fables']['volumename'], "Jack of Fables")
+            self.assertEquals(c.requested, [])
+            self.assertEquals(c.loaded, [1])
+            self.assertEquals(c.corrections.get('jack of fables')['score'], 0)
+        finally:
+            shutil.rmtree(tmpdir)
+
+class test_comicvine_normalize(unittest.TestCase):
+    def test_equivalent_names_share_lookup(self):
+        """Different spellings of one name are searched for once
+        """
+        c = OfflineComicvine(["Y: The Last Man", "The Last Man Standing"])
+        self.assertEquals(c['Y: The Last Man']['volumename'], "Y: The Last Man")
+        self.assertEquals(c['y the last man']['volumename'], "Y: The Last Man")
+        self.assertEquals(c['Y - The Last Man ']['volumename'], "Y: The Last Man")
+        self.assertEquals(len(c.requested), 1)
+
+    def test_normalize_name(self):
+        """Punctuation, case, accents and leading articles are folded
+        """
+        self.assertEquals(comicvine_match.normalize_name("The Amazing Spider-Man"), u"amazing spider man")
+        self.assertEquals(comicvine_match.normalize_name(u"Ast\xe9rix"), u"asterix")
+        self.assertEquals(comicvine_match.normalize_name("The"), u"the")
+        self.assertEquals(comicvine_match.normalize_name("A.B.C. Warriors"), u"a b c warriors")
+
+class test_comicvine_volume_reuse(unittest.TestCase):
+    def test_same_id_loaded_once(self):
+        """Names and ids resolving to one volume share a single load
+        """
+        c = OfflineComicvine(["Fables", "Jack of Fables"])
+        c['fables']
+        c['Fables!']
+        c[0]
+        self.assertEquals(c.loaded, [0])
+
+    def test_concurrent_loads(self):
+        """Threads loading the same volume at once only load it once
+        """
+        class SlowComicvine(OfflineComicvine):
+            def _getvolumeData(self, sid, fields = None):
+                time.sleep(0.1)
+                OfflineComicvine._getvolumeData(self, sid, fields)
+        c = SlowComicvine(["Fables"])
+        threads = [threading.Thread(target = lambda: c[0]) for x in range(10)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEquals(c.loaded, [0])
+
+class test_comicvine_negative_cache(unittest.TestCase):
+    def test_repeated_miss(self):
+        """A name which found nothing is not searched for again
+        """
+        c = OfflineComicvine([])
+        self.assertRaises(comicvine_volumenotfound, lambda: c['a junk filename'])
+        self.assertRaises(comicvine_volumenotfound, lambda: c['a junk filename'])
+        self.assertEquals(len(c.requested), 1)
+
+    def test_shared_on_disk(self):
+        """Misses stored on disk are seen by other instances
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            c = OfflineComicvine([], negative_cache = tmpdir)
+            self.assertRaises(comicvine_volumenotfound, lambda: c['a junk filename'])
+            c = OfflineComicvine([], negative_cache = tmpdir)
+            self.assertRaises(comicvine_volumenotfound, lambda: c['a junk filename'])
+            self.assertEquals(c.requested, [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+class test_comicvine_transport(unittest.TestCase):
+    def test_connections_reused(self):
+        """The default transport reuses one connection for many requests
+        """
+        server = StandInServer({'/a': (200, {}, 'first'), '/b': (200, {}, 'second')})
+        server.start()
+        handler = KeepAliveHandler()
+        try:
+            opener = urllib2.build_opener(handler)
+            for x in range(5):
+                self.assertEquals(opener.open(server.url + '/a').read(), 'first')
+                self.assertEquals(opener.open(server.url + '/b').read(), 'second')
+            self.assertRaises(urllib2.HTTPError, lambda: opener.open(server.url + '/missing'))
+            self.assertEquals(server.requests, 11)
+            self.assertEquals(server.connections, 1)
+        finally:
+            handler.pool.close()
+            server.stop()
+
+class test_comicvine_volume_document(unittest.TestCase):
+    def test_incremental_parse(self):
+        """The volume document is parsed field by field and issue by issue
+        """
+        doc = (
+            "<response><error>OK</error><results><id>6223</id><name>Fables</name>"
+            "<site_detail_url>http://comicvine.com/fables/49-6223/</site_detail_url>"
+            "<issues>%s</issues><publisher>Vertigo</publisher></results></response>" % "".join(
+                "<issue><id>%d</id><name>Issue %d</name></issue>" % (n, n) for n in range(1, 501))
+        )
+        c = comicvine_api.Comicvine(cache = False)
+        siteDetailUrl, issueNames = c._parseVolumeDocument(6223, StringIO.StringIO(doc))
+        self.assertEquals(siteDetailUrl, "http://comicvine.com/fables/49-6223/")
+        self.assertEquals(len(issueNames), 500)
+        self.assertEquals(issueNames[500], "Issue 500")
+        self.assertEquals(c.volume[6223]['volumename'], "Fables")
+        self.assertEquals(c.volume[6223]['publisher'], "Vertigo")
+        self.assertFalse('error' in c.volume[6223].data)
+        self.assertRaises(comicvine_error, c._parseVolumeDocument, 1,
+            StringIO.StringIO("<response><error>Object Not Found</error></response>"))
+
+LIBRARY = {
+    18122: (u"Y: The Last Man", [u"Unmanned", u"Unmanned Chapter Two", u"Unmanned Chapter Three",
+        u"Unmanned Chapter Four", u"Unmanned Chapter Five", u"Cycles", u"Cycles Chapter Two"]),
+    18123: (u"The Last Man Standing", [u"Standing"]),
+    6223: (u"Fables", [u"Legends in Exile %d" % n for n in range(1, 13)]),
+}
+
+class TruncatingServer(ComicvineStandIn):
+    """Stand-in which cuts off the body of the first response to a path
+    containing truncate half way
+    """
+    def __init__(self, library, truncate, **kwargs):
+        ComicvineStandIn.__init__(self, library, **kwargs)
+        self.truncate = truncate
+        self.truncated = 0
+
+    def respond(self, path, headers):
+        status, headers, body = ComicvineStandIn.respond(self, path, headers)
+        if self.truncate in path and not self.truncated:
+            self.truncated += 1
+            body = body[:len(body) // 2]
+        return status, headers, body
+
+class test_comicvine_standin(unittest.TestCase):
+    def setUp(self):
+        self.server = ComicvineStandIn(LIBRARY, issues_per_page = 3)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_volume_from_standin(self):
+        """A volume is searched for, loaded and scraped from the stand-in
+        """
+        c = self.server.point_at(comicvine_api.Comicvine(cache = False))
+        self.assertEquals(c['y: the last man']['volumename'], u"Y: The Last Man")
+        self.assertEquals(c['y: the last man'][1]['issuename'], u"Unmanned")
+        self.assertEquals(c['y: the last man'][7]['issuename'], u"Cycles Chapter Two")
+        self.assertEquals(len(c['y: the last man']), 7)
+
+    def test_prefetch(self):
+        """prefetch loads every distinct name once and reports failures
+        """
+        c = self.server.point_at(comicvine_api.Comicvine(cache = False))
+        summary = c.prefetch(['Y: The Last Man', 'y the last man', 'Fables', 6223,
+            'a junk filename'], workers = 3)
+        self.assertEquals(summary['loaded'], {u'y the last man': 18122, u'fables': 6223, 6223: 6223})
+        self.assertEquals(summary['errors'].keys(), [u'junk filename'])
+        self.assertEquals(len(summary['timings']), 4)
+        requests = self.server.requests
+        self.assertEquals(len(c['Y - The Last Man']), 7)
+        self.assertEquals(len(c['fables']), 12)
+        self.assertEquals(self.server.requests, requests)
+
+    def test_scan_site_detail(self):
+        """Scanning a site detail page in chunks finds what scanning it
+        whole does, wherever the chunks are cut
+        """
+        c = comicvine_api.Comicvine(cache = False)
+        page = self.server.site_detail_html(6223, 2)
+        whole = (c._siteDetailLastPage(page), c._siteDetailIssues(page))
+        self.assertEquals(len(whole[1]), 3)
+        for chunk_size in (7, 100, len(page)):
+            self.assertEquals(
+                c._scanSiteDetail(StringIO.StringIO(page), chunk_size), whole)
+
+    def test_coalesced_requests(self):
+        """Threads loading the same URL at the same time share one request
+        """
+        self.server.latency = 0.2
+        c = self.server.point_at(comicvine_api.Comicvine(cache = False))
+        url = c.config['url_volumeInfo'] % 6223
+        threads = [threading.Thread(target = c._loadUrl, args = (url,)) for x in range(5)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEquals(self.server.requests, 1)
+        self.assertEquals(c.urlflight.stats(), {'issued': 1, 'coalesced': 4})
+
+    def test_coalescing_scope(self):
+        """Only instances sharing a cache location share requests
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            first, second = [comicvine_api.Comicvine(cache = tmpdir) for x in range(2)]
+            self.assertTrue(first.urlflight is second.urlflight)
+            self.assertFalse(first.urlflight is comicvine_api.Comicvine(cache = False).urlflight)
+            self.assertFalse(comicvine_api.Comicvine(cache = False).urlflight is
+                comicvine_api.Comicvine(cache = False).urlflight)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_coalesced_volumes(self):
+        """Instances sharing a cache location looking up the same volume at
+        the same time send each request once, and each gets the volume
+        """
+        self.server.latency = 0.2
+        tmpdir = tempfile.mkdtemp()
+        try:
+            instances = [self.server.point_at(comicvine_api.Comicvine(cache = tmpdir))
+                for x in range(4)]
+            volumes = {}
+            def lookup(c):
+                volumes[c] = c[6223]
+            threads = [threading.Thread(target = lookup, args = (c,)) for c in instances]
+            [t.start() for t in threads]
+            [t.join() for t in threads]
+            self.assertEquals(len([p for p in self.server.paths if p.startswith('/volume/6223/')]), 1)
+            self.assertEquals(len(self.server.paths), len(set(self.server.paths)))
+            for c in instances:
+                self.assertEquals(volumes[c][12]['issuename'], u"Legends in Exile 12")
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_concurrent_site_detail(self):
+        """Site detail pages after the first are fetched at the same time,
+        and their issues kept in page order
+        """
+        self.server.latency = 0.2
+        c = self.server.point_at(comicvine_api.Comicvine(cache = False, workers = 4))
+        start = time.time()
+        volume = c[6223]
+        # Volume document, page 1, then pages 2 to 4 together
+        self.assertTrue(time.time() - start < 0.9)
+        self.assertEquals([volume[n]['issuename'] for n in range(1, 13)],
+            [u"Legends in Exile %d" % n for n in range(1, 13)])
+
+    def test_json_format(self):
+        """format = 'json' gives the same search results and volumes as XML
+        """
+        volumes = {}
+        for format in ('xml', 'json'):
+            c = self.server.point_at(comicvine_api.Comicvine(
+                cache = False, format = format))
+            volumes[format] = (list(c.iter_search('the last man')), c['y the last man'])
+        xmlsearch, xmlvolume = volumes['xml']
+        jsonsearch, jsonvolume = volumes['json']
+        self.assertEquals(jsonsearch, xmlsearch)
+        self.assertEquals(jsonvolume.data, xmlvolume.data)
+        self.assertEquals(jsonvolume, xmlvolume)
+        self.assertEquals(jsonvolume[7]['issuename'], u"Cycles Chapter Two")
+        self.assertTrue([p for p in self.server.paths if 'format=json' in p])
+
+    def test_field_projection(self):
+        """Only the projected fields are requested, others are fetched when
+        first used
+        """
+        c = self.server.point_at(comicvine_api.Comicvine(
+            cache = False, fields = ['publisher']))
+        volume = c[6223]
+        self.assertEquals(volume['publisher'], u"Stand-in Comics")
+        self.assertEquals(volume[12]['issuename'], u"Legends in Exile 12")
+        self.assertFalse('description' in volume.data)
+        requests = self.server.requests
+        self.assertEquals(volume['description'], u"<p>Fables</p>")
+        self.assertEquals(self.server.requests, requests + 1)
+        self.assertTrue(self.server.paths[-1].endswith('field_list=description'))
+        self.assertRaises(comicvine_attributenotfound, lambda: volume['no_such_field'])
+        self.assertRaises(comicvine_attributenotfound, lambda: volume['no_such_field'])
+        self.assertEquals(self.server.requests, requests + 2)
+
+        # Per lookup, for a volume already loaded
+        c.get(6223, fields = ['deck', 'description'])
+        self.assertEquals(self.server.requests, requests + 3)
+        self.assertTrue(self.server.paths[-1].endswith('field_list=deck'))
+
+    def test_gzip_responses(self):
+        """gzip is asked for, and gzipped responses are decompressed both
+        from the network and from the cache
+        """
+        self.server.gzip = True
+        tmpdir = tempfile.mkdtemp()
+        try:
+            c = self.server.point_at(comicvine_api.Comicvine(cache = tmpdir))
+            self.assertEquals(c[6223][12]['issuename'], u"Legends in Exile 12")
+            requests, sent = self.server.requests, self.server.bytes_sent
+
+            c = self.server.point_at(comicvine_api.Comicvine(cache = tmpdir))
+            self.assertEquals(c[6223][12]['issuename'], u"Legends in Exile 12")
+            self.assertEquals(self.server.requests, requests)
+        finally:
+            shutil.rmtree(tmpdir)
+        identity = sum(len(self.server.respond(path, {})[2]) for path in self.server.paths)
+        self.assertTrue(sent < identity)
+
+class ConditionalServer(StandInServer):
+    """Serves /tagged with an ETag, answering 304 Not Modified when it is
+    sent back, and /untagged without one
+    """
+    def respond(self, path, headers):
+        if path == '/tagged' and headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, ''
+        if path == '/tagged':
+            return 200, {'ETag': '"v1"'}, '<response>tagged</response>'
+        return 200, {}, '<response>untagged</response>'
+
+class test_comicvine_revalidation(unittest.TestCase):
+    def setUp(self):
+        self.server = ConditionalServer()
+        self.server.start()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_not_modified(self):
+        """An expired response with an ETag is revalidated, and kept without
+        being downloaded again when it has not changed
+        """
+        transport = KeepAliveHandler()
+        opener = urllib2.build_opener(CacheHandler(self.tmpdir, max_age = 0), transport)
+        try:
+            self.assertEquals(opener.open(self.server.url + '/tagged').read(), '<response>tagged</response>')
+            sent = self.server.bytes_sent
+            resp = opener.open(self.server.url + '/tagged')
+            self.assertEquals(resp.read(), '<response>tagged</response>')
+            self.assertTrue('x-local-cache' in resp.headers)
+            self.assertEquals(self.server.bytes_sent, sent)
+
+            opener.open(self.server.url + '/untagged').read()
+            sent = self.server.bytes_sent
+            self.assertEquals(opener.open(self.server.url + '/untagged').read(), '<response>untagged</response>')
+            self.assertTrue(self.server.bytes_sent > sent)
+            self.assertEquals(self.server.requests, 4)
+            self.assertEquals(self.server.connections, 1)
+        finally:
+            transport.pool.close()
+
+class test_comicvine_replay(unittest.TestCase):
+    def test_record_and_replay(self):
+        """Responses recorded from a server are replayed without it
+        """
+        server = ComicvineStandIn(LIBRARY, issues_per_page = 3, gzip = True)
+        server.start()
+        fixtures = tempfile.mkdtemp()
+        try:
+            transport = KeepAliveHandler()
+            c = server.point_at(comicvine_api.Comicvine(cache = False,
+                transport = RecordHandler(transport, fixtures)))
+            self.assertEquals(c['y the last man'][7]['issuename'], u"Cycles Chapter Two")
+            transport.pool.close()
+            server.stop()
+            recorded = server.requests
+
+            replay = ReplayHandler(fixtures)
+            c = server.point_at(comicvine_api.Comicvine(cache = False,
+                apikey = "another key", transport = replay, retries = 0))
+            self.assertEquals(c['y the last man'][7]['issuename'], u"Cycles Chapter Two")
+            self.assertEquals(c['y the last man'][1]['id'], 18122001)
+            self.assertEquals(replay.replayed, recorded)
+            self.assertRaises(comicvine_error, c._loadUrl, server.url + "/not/recorded/")
+        finally:
+            shutil.rmtree(fixtures)
+
+    def test_revalidation_not_recorded(self):
+        """A 304 to a revalidation leaves the recorded full response alone
+        """
+        server = ConditionalServer()
+        server.start()
+        fixtures = tempfile.mkdtemp()
+        cachedir = tempfile.mkdtemp()
+        try:
+            transport = KeepAliveHandler()
+            opener = urllib2.build_opener(CacheHandler(cachedir, max_age = 0),
+                RecordHandler(transport, fixtures))
+            opener.open(server.url + '/tagged').read()
+            opener.open(server.url + '/tagged').read()
+            transport.pool.close()
+            self.assertEquals(server.requests, 2)
+
+            opener = urllib2.build_opener(ReplayHandler(fixtures))
+            self.assertEquals(opener.open(server.url + '/tagged').read(), '<response>tagged</response>')
+        finally:
+            server.stop()
+            shutil.rmtree(fixtures)
+            shutil.rmtree(cachedir)
+
+    def test_recache_replayed(self):
+        """A corrupt cached response is downloaded again through the
+        instance's transport, here replaying a recording
+        """
+        server = StandInServer({'/doc': (200, {}, '<response>ok</response>')})
+        server.start()
+        fixtures = tempfile.mkdtemp()
+        cachedir = tempfile.mkdtemp()
+        try:
+            transport = KeepAliveHandler()
+            urllib2.build_opener(RecordHandler(transport, fixtures)).open(server.url + '/doc').read()
+            transport.pool.close()
+            server.stop()
+
+            hpath, bpath = calculate_cache_path(cachedir, server.url + '/doc')
+            open(hpath, "w").write("Content-Type: text/xml\r\n")
+            open(bpath, "w").write("<response>o")
+            replay = ReplayHandler(fixtures)
+            c = comicvine_api.Comicvine(cache = cachedir, transport = replay)
+            self.assertEquals(c._getetsrc(server.url + '/doc').text, 'ok')
+            self.assertEquals(replay.replayed, 1)
+            self.assertEquals(open(bpath).read(), '<response>ok</response>')
+        finally:
+            shutil.rmtree(fixtures)
+            shutil.rmtree(cachedir)
+
+class test_comicvine_streaming(unittest.TestCase):
+    def setUp(self):
+        self.server = TruncatingServer(LIBRARY, '/volume/', issues_per_page = 3, gzip = True)
+        self.server.start()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_parsed_while_cached(self):
+        """Volume documents are parsed as they are read and stored in the
+        cache, except for bodies which were not valid XML
+        """
+        c = self.server.point_at(comicvine_api.Comicvine(cache = self.tmpdir))
+        self.assertEquals(c[6223][12]['issuename'], u"Legends in Exile 12")
+        self.assertEquals(self.server.paths.count('/volume/6223/?api_key=%s' % c.config['apikey']), 2)
+        self.assertEquals([f for f in os.listdir(self.tmpdir) if f.endswith('.part')], [])
+
+        requests = self.server.requests
+        c = self.server.point_at(comicvine_api.Comicvine(cache = self.tmpdir))
+        self.assertEquals(c[6223][12]['issuename'], u"Legends in Exile 12")
+        self.assertEquals(self.server.requests, requests)
+
+class test_comicvine_corrupt_gzip(unittest.TestCase):
+    def test_nothing_left_behind(self):
+        """A corrupt gzipped body raises comicvine_error, and its partly
+        written cache entry is removed
+        """
+        body = gzip_body("<response>%s</response>" % ("x" * 50000))
+        server = StandInServer({'/corrupt': (200, {'Content-Encoding': 'gzip'},
+            body[:10] + "\xff" * 300 + body[310:])})
+        server.start()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            c = comicvine_api.Comicvine(cache = tmpdir)
+            self.assertRaises(comicvine_error, c._loadUrl, server.url + '/corrupt')
+            self.assertRaises(comicvine_error, c._parseUrl, server.url + '/corrupt',
+                lambda source: source.read())
+            self.assertEquals(os.listdir(tmpdir), [])
+        finally:
+            server.stop()
+            shutil.rmtree(tmpdir)
+
+class test_comicvine_validation(unittest.TestCase):
+    def setUp(self):
+        self.server = TruncatingServer(LIBRARY, '49-', issues_per_page = 3)
+        self.server.start()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_truncated_page_retried(self):
+        """A truncated site detail page is downloaded again, and only the
+        complete one is cached
+        """
+        c = self.server.point_at(comicvine_api.Comicvine(cache = self.tmpdir))
+        url = c.config['url_siteDetail'] % (self.server.site_detail_url(6223), 1)
+        self.assertTrue(c._loadUrl(url).rstrip().endswith("</html>"))
+        self.assertEquals(self.server.truncated, 1)
+        self.assertEquals(len(self.server.paths), 2)
+
+        requests = self.server.requests
+        self.assertTrue(c._loadUrl(url).rstrip().endswith("</html>"))
+        self.assertEquals(self.server.requests, requests)
+
+    def test_truncated_page_scanned_again(self):
+        """A site detail page scanned while it downloads is downloaded and
+        scanned again if it turns out truncated
+        """
+        c = self.server.point_at(comicvine_api.Comicvine(cache = self.tmpdir))
+        url = c.config['url_siteDetail'] % (self.server.site_detail_url(6223), 1)
+        last, issues = c._parseUrl(url, c._scanSiteDetail)
+        self.assertEquals(self.server.truncated, 1)
+        self.assertEquals(len(self.server.paths), 2)
+        self.assertEquals((last, issues),
+            (c._siteDetailLastPage(c._loadUrl(url)), c._siteDetailIssues(c._loadUrl(url))))
+        self.assertEquals(len(self.server.paths), 2)
+
+    def test_one_download_again(self):
+        """A body which stays corrupt is downloaded twice per lookup at
+        most, and never cached
+        """
+        server = StandInServer({'/broken': (200, {}, "<response><results>")})
+        server.start()
+        try:
+            c = comicvine_api.Comicvine(cache = self.tmpdir)
+            url = server.url + '/broken'
+            self.assertRaises(comicvine_error, c._getetsrc, url)
+            self.assertEquals(server.requests, 2)
+            self.assertRaises(comicvine_error, c._parseUrl, url,
+                comicvine_api.ElementTree.parse)
+            self.assertEquals(server.requests, 4)
+            self.assertEquals(c._loadUrl(url), "<response><results>")
+            self.assertEquals(server.requests, 6)
+            self.assertEquals(os.listdir(self.tmpdir), [])
+        finally:
+            server.stop()
+
+    def test_store_rejects_corrupt_body(self):
+        """store_in_cache leaves nothing behind for a body which is not
+        well-formed
+        """
+        class Response(StringIO.StringIO):
+            def info(self):
+                return httplib.HTTPMessage(StringIO.StringIO("Content-Type: text/xml\r\n"))
+        url = "http://example.com/volume/1/"
+        self.assertTrue(store_in_cache(self.tmpdir, url, Response("<response><results>")))
+        self.assertFalse(exists_in_cache(self.tmpdir, url, 60))
+        self.assertEquals(os.listdir(self.tmpdir), [])
+        self.assertFalse(store_in_cache(self.tmpdir, url, Response("<response></response>")))
+        self.assertTrue(exists_in_cache(self.tmpdir, url, 60))
+
+class test_comicvine_parsed_cache(unittest.TestCase):
+    def setUp(self):
+        self.server = ComicvineStandIn(LIBRARY, issues_per_page = 3)
+        self.server.start()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def comicvine(self, **kwargs):
+        return self.server.point_at(comicvine_api.Comicvine(
+            cache = self.tmpdir, **kwargs))
+
+    def test_warm_lookup_skips_parsing(self):
+        """A volume loaded before is read back without parsing anything
+        """
+        cold = self.comicvine()[18122]
+
+        def fail(*args):
+            self.fail("parsed again")
+        c = self.comicvine()
+        c._parseUrl = c._loadParsed = c._parseSiteDetail = fail
+        warm = c[18122]
+        self.assertEquals(warm.data, cold.data)
+        self.assertEquals(warm, cold)
+        self.assertEquals(warm[7]['issuename'], u"Cycles Chapter Two")
+
+        c = self.comicvine(parsed_cache = False)
+        c._scanSiteDetail = fail
+        self.assertRaises(AssertionError, c.__getitem__, 18122)
+
+    def test_keyed_by_body(self):
+        """A changed volume document is parsed again
+        """
+        c = self.comicvine()
+        c[6223]
+        url = c._volumeUrl(6223)
+        hpath, bpath = calculate_cache_path(self.tmpdir, url)
+        open(bpath, "wb").write(self.server.volume_xml(18123))
+        headers = open(hpath).read().replace("x-body-md5:", "x-old-md5:")
+        open(hpath, "w").write(headers + "x-body-md5: changed\r\n")
+
+        c = self.comicvine()
+        self.assertEquals(c[6223]['volumename'], u"The Last Man Standing")
+
+class test_comicvine_breaker(unittest.TestCase):
+    def setUp(self):
+        class BrokenSiteDetail(ComicvineStandIn):
+            def respond(self, path, headers):
+                if '/49-' in path:
+                    return 500, {}, "Internal error"
+                return ComicvineStandIn.respond(self, path, headers)
+        self.server = BrokenSiteDetail(LIBRARY)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_failing_endpoint_fails_fast(self):
+        """Once the site detail pages keep failing, they are no longer
+        requested, while searches still are
+        """
+        # Its own API key, so the backoff from the failures holds back no
+        # other test's requests
+        c = self.server.point_at(comicvine_api.Comicvine(
+            cache = False, apikey = "failing-endpoint", breaker_reset = 60
+        ))
+        for attempt in range(5):
+            self.assertRaises(comicvine_error, c._loadVolume, 18122)
+        self.assertEquals(c.breakers['site_detail'].state, 'open')
+
+        requests = self.server.requests
+        self.assertRaises(comicvine_unavailable, c._loadVolume, 18122)
+        self.assertEquals(self.server.requests, requests + 1) # Only the volume document
+        self.assertEquals(c.breakers.stats()['site_detail']['rejected'], 1)
+
+        self.assertEquals([r['id'] for r in c.iter_search('fables')], [6223])
+        self.assertEquals(c.breakers['search'].state, 'closed')
+
+    def test_half_open_probe(self):
+        """After breaker_reset one request is let through, and closes the
+        breaker again if it succeeds
+        """
+        breaker = CircuitBreaker('volume', min_requests = 1, reset_timeout = 0)
+        breaker.before()
+        breaker.failure()
+        self.assertEquals(breaker.state, 'open')
+        breaker.before()
+        self.assertEquals(breaker.state, 'half_open')
+        self.assertRaises(comicvine_unavailable, breaker.before)
+        breaker.success()
+        self.assertEquals(breaker.state, 'closed')
+
+class test_comicvine_async(unittest.TestCase):
+    def setUp(self):
+        self.server = ComicvineStandIn(LIBRARY, issues_per_page = 3)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    @unittest.skipIf(comicvine_async.asyncio is None, "trollius is not installed")
+    def test_async_lookup(self):
+        """AsyncComicvine loads the same volume as Comicvine
+        """
+        asyncio = comicvine_async.asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            c = self.server.point_at(comicvine_async.AsyncComicvine(loop = loop, cache = False))
+            both = asyncio.gather(c['y: the last man'], c['Y - The Last Man'], loop = loop)
+            first, second = loop.run_until_complete(both)
+        finally:
+            loop.close()
+        self.assertTrue(first is second)
+        self.assertEquals(first['volumename'], u"Y: The Last Man")
+        self.assertEquals(first[7]['issuename'], u"Cycles Chapter Two")
+        self.assertEquals(len(first), 7)
+
+    @unittest.skipIf(comicvine_async.asyncio is None, "trollius is not installed")
+    def test_connection_refused(self):
+        """A refused connection is retried, then raised as comicvine_error
+        """
+        asyncio = comicvine_async.asyncio
+        url = self.server.url + '/'
+        self.server.stop()
+        loop = asyncio.new_event_loop()
+        try:
+            c = comicvine_async.AsyncComicvine(loop = loop, cache = False,
+                apikey = "refused", rate_limit = 1000, retries = 1)
+            self.assertRaises(comicvine_error, loop.run_until_complete, c._loadUrlAsync(url))
+            self.assertEquals(c.limiter.failures, 2)
+        finally:
+            loop.close()
+
+class test_comicvine_ratelimit(unittest.TestCase):
+    def test_backoff_grows(self):
+        """Each failure holds requests back for longer
+        """
+        bucket = TokenBucket(rate = 100, burst = 10, backoff = 1.0)
+        self.assertEquals(bucket.reserve(), 0)
+        bucket.failure()
+        first = bucket.reserve()
+        self.assertTrue(0.4 < first <= 1.0)
+        bucket.failure()
+        bucket.failure()
+        self.assertTrue(bucket.reserve() > first)
+
+    def test_retry_after_honoured(self):
+        """A throttled request is retried after the server's Retry-After
+        """
+        class ThrottlingServer(StandInServer):
+            def respond(self, path, headers):
+                if self.requests < 3:
+                    return 429, {'Retry-After': '0'}, 'Slow down'
+                return 200, {}, 'ok'
+        server = ThrottlingServer()
+        server.start()
+        transport = KeepAliveHandler()
+        try:
+            opener = urllib2.build_opener(
+                ThrottleHandler(transport, TokenBucket(rate = 100, burst = 10), retries = 3)
+            )
+            self.assertEquals(opener.open(server.url + '/').read(), 'ok')
+            self.assertEquals(server.requests, 3)
+        finally:
+            transport.pool.close()
+            server.stop()
+
 class test_comicvine_doctest(unittest.TestCase):
     # Used to store the cached instance of Comicvine()
     c = None
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+#encoding:utf-8
+#author:swc/Steve
+#project:comicvine_api
+#repository:http://github.com/swc/comicvine_api
+#license:Creative Commons GNU GPL v2
+# (http://creativecommons.org/licenses/GPL/2.0/)
+
+"""urllib2 transports used by Comicvine to talk to the network.
+
+A transport is a urllib2.HTTPHandler (sub)class instance. It is passed to
+urllib2.build_opener after the CacheHandler, so it is only used for requests
+the cache cannot answer.
+
+KeepAliveHandler, the default, keeps HTTP/1.1 connections open after each
+response and reuses them for later requests to the same host, instead of
+opening a new TCP connection for every search page, volume document and
+site detail page:
+
+>>> import urllib2
+>>> opener = urllib2.build_opener(KeepAliveHandler(pool_size = 2, timeout = 10))
+
+RecordHandler wraps another transport and saves every response it gets to
+a fixture directory. ReplayHandler serves those responses again without
+touching the network, optionally with simulated latency and bandwidth, so
+lookups can be tested and timed offline and reproducibly:
+
+>>> from comicvine_api import Comicvine
+>>> c = Comicvine(cache = False, transport = RecordHandler(KeepAliveHandler(), "fixtures"))
+>>> c['Y: The Last Man'][1]['issuename']
+'Unmanned'
+>>> c = Comicvine(cache = False, transport = ReplayHandler("fixtures", latency = 0.1))
+>>> c['Y: The Last Man'][1]['issuename']
+'Unmanned'
+"""
+from __future__ import with_statement
+
+__author__ = "swc/Steve"
+__version__ = "1.00"
+
+import os
+import time
+import errno
+import socket
+import httplib
+import urllib2
+import urlparse
+import StringIO
+from hashlib import md5
+from threading import RLock
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+class ConnectionPool(object):
+    """Holds idle keep-alive connections, at most maxsize per host
+    """
+    def __init__(self, maxsize = 4, timeout = 30):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = RLock()
+        self.idle = {}
+        self.created = 0
+        self.reused = 0
+
+    def get(self, scheme, host):
+        """Returns (connection, reused) for scheme://host, reused being
+        True if the connection was taken from the pool
+        """
+        with self.lock:
+            idle = self.idle.get((scheme, host))
+            if idle:
+                self.reused += 1
+                return idle.pop(), True
+            self.created += 1
+        if scheme == "https":
+            return httplib.HTTPSConnection(host, timeout = self.timeout), False
+        return httplib.HTTPConnection(host, timeout = self.timeout), False
+
+    def put(self, scheme, host, connection):
+        """Returns a connection whose last response was fully read to the
+        pool, or closes it if the pool for that host is full
+        """
+        with self.lock:
+            idle = self.idle.setdefault((scheme, host), [])
+            if len(idle) < self.maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Closes every idle connection
+        """
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class PooledResponse(object):
+    """The body of a response on a pooled connection. Once the body has been
+    read to the end, the connection goes back to the pool. If it is closed
+    before that, the connection is discarded.
+    """
+    def __init__(self, pool, scheme, host, connection, response):
+        self.pool = pool
+        self.scheme = scheme
+        self.host = host
+        self.connection = connection
+        self.response = response
+
+    def recv(self, amt = None):
+        if self.response is None:
+            return ""
+        if amt is None:
+            data = self.response.read()
+        else:
+            data = self.response.read(amt)
+        if self.response.isclosed():
+            self._release()
+        return data
+    read = recv
+
+    def _release(self):
+        connection, self.connection = self.connection, None
+        response, self.response = self.response, None
+        if connection is None:
+            return
+        if response.isclosed() and not response.will_close:
+            self.pool.put(self.scheme, self.host, connection)
+        else:
+            connection.close()
+
+    def close(self):
+        self._release()
+
+
+class KeepAliveHandler(urllib2.HTTPHandler):
+    """HTTP transport which reuses connections from a ConnectionPool
+    """
+    def __init__(self, pool = None, pool_size = 4, timeout = 30):
+        """pool is a ConnectionPool to share with other handlers, otherwise
+        a new one is made holding up to pool_size idle connections per host,
+        with timeout (in seconds) for connecting and reading
+        """
+        urllib2.HTTPHandler.__init__(self)
+        if pool is None:
+            pool = ConnectionPool(maxsize = pool_size, timeout = timeout)
+        self.pool = pool
+
+    def http_open(self, req):
+        return self._open(req, "http")
+
+    def _open(self, req, scheme):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError("no host given")
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(req.headers)
+        headers = dict((name.title(), value) for name, value in headers.items())
+        headers["Connection"] = "keep-alive"
+
+        while True:
+            connection, reused = self.pool.get(scheme, host)
+            try:
+                connection.request(req.get_method(), req.get_selector(), req.data, headers)
+                response = connection.getresponse()
+            except (socket.error, httplib.HTTPException), errormsg:
+                connection.close()
+                if reused:
+                    # The server closed the idle connection, try another
+                    continue
+                raise urllib2.URLError(errormsg)
+            break
+
+        body = PooledResponse(self.pool, scheme, host, connection, response)
+        fp = socket._fileobject(body, close = True)
+        resp = urllib2.addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+
+def fixture_key(url):
+    """Returns the name recordings of url are stored under. The scheme,
+    host and api_key are left out, and the query parameters sorted, so
+    recordings can be replayed against another server or with another key
+    """
+    parts = urlparse.urlsplit(url)
+    query = sorted(p for p in parts.query.split("&") if p and not p.startswith("api_key="))
+    return md5("%s?%s" % (parts.path, "&".join(query))).hexdigest()
+
+
+class ThrottledBody(StringIO.StringIO):
+    """A recorded body, read no faster than bandwidth bytes per second
+    """
+    def __init__(self, body, bandwidth = None):
+        StringIO.StringIO.__init__(self, body)
+        self.bandwidth = bandwidth
+
+    def read(self, n = -1):
+        data = StringIO.StringIO.read(self, n)
+        if self.bandwidth:
+            time.sleep(len(data) / float(self.bandwidth))
+        return data
+
+
+class RecordHandler(urllib2.HTTPHandler):
+    """Wraps a transport, storing every request's response in fixture_dir
+    as [fixture_key].json (URL, status and headers) and [fixture_key].body
+    (the body as sent, so still gzipped if it was). 304 Not Modified
+    responses to revalidations are not stored, so they never replace the
+    recording of the full response
+    """
+    def __init__(self, transport, fixture_dir):
+        urllib2.HTTPHandler.__init__(self)
+        self.transport = transport
+        self.fixture_dir = fixture_dir
+        try:
+            os.makedirs(fixture_dir)
+        except OSError, e:
+            if e.errno != errno.EEXIST or not os.path.isdir(fixture_dir):
+                raise
+
+    def http_open(self, req):
+        resp = self.transport.http_open(req)
+        body = resp.read()
+        resp.close()
+
+        url = req.get_full_url()
+        if resp.code != httplib.NOT_MODIFIED:
+            path = os.path.join(self.fixture_dir, fixture_key(url))
+            outf = open(path + ".body", "wb")
+            outf.write(body)
+            outf.close()
+            outf = open(path + ".json", "w")
+            json.dump({
+                'url': url,
+                'code': resp.code,
+                'msg': resp.msg,
+                'headers': str(resp.info()).decode("latin-1"),
+            }, outf, indent = 1)
+            outf.close()
+
+        recorded = urllib2.addinfourl(StringIO.StringIO(body), resp.info(), url)
+        recorded.code = resp.code
+        recorded.msg = resp.msg
+        return recorded
+
+
+class ReplayHandler(urllib2.HTTPHandler):
+    """Serves the responses recorded by a RecordHandler in fixture_dir,
+    never using the network. latency (in seconds) is added before every
+    response, and bodies are read at no more than bandwidth bytes per
+    second. Requests which were not recorded raise URLError
+    """
+    def __init__(self, fixture_dir, latency = 0, bandwidth = None):
+        urllib2.HTTPHandler.__init__(self)
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.lock = RLock()
+        self.replayed = 0
+
+    def http_open(self, req):
+        url = req.get_full_url()
+        path = os.path.join(self.fixture_dir, fixture_key(url))
+        try:
+            with open(path + ".json") as inf:
+                recording = json.load(inf)
+            with open(path + ".body", "rb") as inf:
+                body = inf.read()
+        except IOError:
+            raise urllib2.URLError("no recording of %s in %s" % (url, self.fixture_dir))
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.replayed += 1
+        headers = httplib.HTTPMessage(StringIO.StringIO(recording['headers'].encode("latin-1")))
+        resp = urllib2.addinfourl(ThrottledBody(body, self.bandwidth), headers, url)
+        resp.code = recording['code']
+        resp.msg = recording['msg']
+        return resp